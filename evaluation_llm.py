@@ -1,4 +1,3 @@
-import io
 import os
 import yaml
 import json
@@ -6,12 +5,12 @@ import argparse
 import pandas as pd
 import re
 import cv2
-import base64
 from PIL import Image
 from bs4 import BeautifulSoup
 from utils.parser import parse_code_to_workflow, parse_markdown_to_workflow
 from utils.comfy import execute_workflow
 from utils.llm import invoke_vision
+from utils.vision import VisionPayload
 
 
 
@@ -81,24 +80,21 @@ Then, provide a final judgment of whether the generation result complies with th
 '''
 
 
-def encode_image(image: Image.Image, size: tuple[int, int] = (512, 512)) -> str:
-    image = image.resize(size)
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
-    base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return base64_image
+# Images are loaded as (image, source) pairs; the payload optimizer picks
+# their size, detail and format, and reuses encoded reference images
+vision_payload = VisionPayload()
 
 
-def load_image(image_path: str, size_limit: tuple[int, int] = (512, 512)) -> tuple[str, dict]:
+def load_image(image_path: str) -> tuple[list, dict]:
     meta_info = {}
     image = Image.open(image_path)
+    image.load()
     meta_info['width'], meta_info['height'] = image.size
-    base64_image = encode_image(image, size_limit)
-    return base64_image, meta_info
+    return [(image, (image_path, 0))], meta_info
 
 
-def load_video_mp4(video_path: str, size_limit: tuple[int, int] = (512, 512), frame_limit: int = 5) -> tuple[list, dict]:
-    base64_frames = []
+def load_video_mp4(video_path: str, frame_limit: int = 5) -> tuple[list, dict]:
+    frames = []
     meta_info = {}
     video = cv2.VideoCapture(video_path)
     meta_info['width'] = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -115,18 +111,15 @@ def load_video_mp4(video_path: str, size_limit: tuple[int, int] = (512, 512), fr
             break
         if count % sample_interval == 0:
             image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            base64_frame = encode_image(image, size_limit)
-            base64_frames.append(base64_frame)
+            frames.append((image, (video_path, count)))
         count += 1
     video.release()
-    return base64_frames, meta_info
+    return frames, meta_info
 
 from PIL import Image, ImageSequence
-import base64
-import io
 
-def load_video(video_path: str, size_limit: tuple[int, int] = (512, 512), frame_limit: int = 5) -> tuple[list, dict]:
-    base64_frames = []
+def load_video(video_path: str, frame_limit: int = 5) -> tuple[list, dict]:
+    frames = []
     meta_info = {}
 
     image = Image.open(video_path)
@@ -140,11 +133,11 @@ def load_video(video_path: str, size_limit: tuple[int, int] = (512, 512), frame_
     sample_interval = max(1, meta_info['num_frames'] // frame_limit)
     for frame in ImageSequence.Iterator(image):
         if count % sample_interval == 0:
-            base64_frame = encode_image(frame, size_limit)
-            base64_frames.append(base64_frame)
+            # The iterator reuses one image object for all frames
+            frames.append((frame.copy(), (video_path, count)))
         count += 1
 
-    return base64_frames, meta_info
+    return frames, meta_info
 
 
 def safe_extract_from_soup(soup: BeautifulSoup, tag: str) -> str:
@@ -162,7 +155,8 @@ def parse_evaluation(evaluation: str) -> tuple[str, str]:
 
 
 def evaluate_t2i(image_path, instruction) -> bool:
-    result_base64_image, result_meta_info = load_image(image_path)
+    result_images, result_meta_info = load_image(image_path)
+    _, result_parts = vision_payload.plan('t2i', [], result_images)
 
     prompt = t2i_prompt.format(
         instruction=instruction,
@@ -172,16 +166,7 @@ def evaluate_t2i(image_path, instruction) -> bool:
     print(prompt)
     print()
 
-    content = [{
-        'type': 'text',
-        'text': prompt
-    }]
-    content.append({
-        "type": "image_url",
-        "image_url": {
-            "url": f"data:image/jpeg;base64,{result_base64_image}"
-        }
-    })
+    content = vision_payload.content('t2i', prompt, [], result_parts)
     message = [{
         "role": "user",
         "content": content
@@ -204,8 +189,9 @@ def evaluate_t2i(image_path, instruction) -> bool:
 
 
 def evaluate_i2i(ref_image_path, res_image_path, instruction) -> bool:
-    reference_base64_image, reference_meta_info = load_image(ref_image_path)
-    result_base64_image, result_meta_info = load_image(res_image_path)
+    reference_images, reference_meta_info = load_image(ref_image_path)
+    result_images, result_meta_info = load_image(res_image_path)
+    reference_parts, result_parts = vision_payload.plan('i2i', reference_images, result_images)
 
     prompt = i2i_prompt.format(
         instruction=instruction,
@@ -216,22 +202,7 @@ def evaluate_i2i(ref_image_path, res_image_path, instruction) -> bool:
     print(prompt)
     print()
 
-    content = [{
-        'type': 'text',
-        'text': prompt
-    }]
-    content.append({
-        "type": "image_url",
-        "image_url": {
-            "url": f"data:image/jpeg;base64,{reference_base64_image}"
-        }
-    })
-    content.append({
-        "type": "image_url",
-        "image_url": {
-            "url": f"data:image/jpeg;base64,{result_base64_image}"
-        }
-    })
+    content = vision_payload.content('i2i', prompt, reference_parts, result_parts)
     message = [{
         "role": "user",
         "content": content
@@ -254,28 +225,19 @@ def evaluate_i2i(ref_image_path, res_image_path, instruction) -> bool:
 
 
 def evaluate_t2v(vid_path, instruction) -> bool:
-    result_base64_frames, result_meta_info = load_video(vid_path)
+    result_frames, result_meta_info = load_video(vid_path)
+    _, result_parts = vision_payload.plan('t2v', [], result_frames)
 
     prompt = t2v_prompt.format(
         instruction=instruction,
-        result_frame_count=len(result_base64_frames),
+        result_frame_count=len(result_parts),
         result_resolution=f'{result_meta_info["width"]}x{result_meta_info["height"]}',
     )
     print(' Evaluator Prompt '.center(80, '-'))
     print(prompt)
     print()
 
-    content = [{
-        'type': 'text',
-        'text': prompt
-    }]
-    for result_base64_frame in result_base64_frames:
-        content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/png;base64,{result_base64_frame}"
-            }
-        })
+    content = vision_payload.content('t2v', prompt, [], result_parts)
     message = [{
         "role": "user",
         "content": content
@@ -298,36 +260,21 @@ def evaluate_t2v(vid_path, instruction) -> bool:
 
 
 def evaluate_i2v(ref_image_path, res_vid_path, instruction) -> bool:
-    reference_base64_image, reference_meta_info = load_image(ref_image_path)
-    result_base64_frames, result_meta_info = load_video(res_vid_path)
+    reference_images, reference_meta_info = load_image(ref_image_path)
+    result_frames, result_meta_info = load_video(res_vid_path)
+    reference_parts, result_parts = vision_payload.plan('i2v', reference_images, result_frames)
 
     prompt = i2v_prompt.format(
         instruction=instruction,
         reference_resolution=f'{reference_meta_info["width"]}x{reference_meta_info["height"]}',
-        result_frame_count=len(result_base64_frames),
+        result_frame_count=len(result_parts),
         result_resolution=f'{result_meta_info["width"]}x{result_meta_info["height"]}',
     )
     print(' Evaluator Prompt '.center(80, '-'))
     print(prompt)
     print()
 
-    content = [{
-        'type': 'text',
-        'text': prompt
-    }]
-    content.append({
-        "type": "image_url",
-        "image_url": {
-            "url": f"data:image/jpeg;base64,{reference_base64_image}"
-        }
-    })
-    for result_base64_frame in result_base64_frames:
-        content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{result_base64_frame}"
-            }
-        })
+    content = vision_payload.content('i2v', prompt, reference_parts, result_parts)
     message = [{
         "role": "user",
         "content": content
@@ -350,38 +297,22 @@ def evaluate_i2v(ref_image_path, res_vid_path, instruction) -> bool:
 
 
 def evaluate_v2v(ref_vid_path, res_vid_path, instruction) -> bool:
-    reference_base64_frames, reference_meta_info = load_video_mp4(ref_vid_path)
-    result_base64_frames, result_meta_info = load_video(res_vid_path)
+    reference_frames, reference_meta_info = load_video_mp4(ref_vid_path)
+    result_frames, result_meta_info = load_video(res_vid_path)
+    reference_parts, result_parts = vision_payload.plan('v2v', reference_frames, result_frames)
 
     prompt = v2v_prompt.format(
         instruction=instruction,
-        reference_frame_count=len(reference_base64_frames),
+        reference_frame_count=len(reference_parts),
         reference_resolution=f'{reference_meta_info["width"]}x{reference_meta_info["height"]}',
-        result_frame_count=len(result_base64_frames),
+        result_frame_count=len(result_parts),
         result_resolution=f'{result_meta_info["width"]}x{result_meta_info["height"]}',
     )
     print(' Evaluator Prompt '.center(80, '-'))
     print(prompt)
     print()
 
-    content = [{
-        'type': 'text',
-        'text': prompt
-    }]
-    for reference_base64_frame in reference_base64_frames:
-        content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{reference_base64_frame}"
-            }
-        })
-    for result_base64_frame in result_base64_frames:
-        content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{result_base64_frame}"
-            }
-        })
+    content = vision_payload.content('v2v', prompt, reference_parts, result_parts)
     message = [{
         "role": "user",
         "content": content
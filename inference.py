@@ -1,11 +1,17 @@
 import os
 import yaml
+import asyncio
 import argparse
 
 from inference_engine.dataflow.pipeline import DataflowPipeline
 from inference_engine.declarative.pipeline import DeclarativePipeline
 from inference_engine.pseudo_natural.pipeline import PseudoNaturalPipeline
 from inference_engine.onestep.pipeline import OneStepPipeline
+from utils.llm import ledger
+from utils.retrieval import warmup, embedding_reports
+from utils.reference_bundle import get_bundle
+from utils.node_docs import get_node_doc_index
+from utils.batch import run_batch, BATCH_PATH
 
 with open('./config.yaml', 'r') as file:
     config = yaml.load(file, Loader=yaml.FullLoader)
@@ -16,10 +22,188 @@ os.environ['https_proxy'] = proxy_config['https_proxy']
 print(f"HTTP Proxy: {os.environ.get('http_proxy')}")
 print(f"HTTPS Proxy: {os.environ.get('https_proxy')}")
 
+# File in a run's checkpoint holding the status of its pipeline: running,
+# then succeeded or failed once it has finished
+STATUS_FILE = 'status'
+
+def build_pipeline(inference_engine_name, task_id, task_info, run_id, checkpoint, args):
+    if inference_engine_name == 'dataflow':
+        key_nodes_path = task_info.get('keynode')
+        if not key_nodes_path:
+            key_nodes_path = os.path.join(os.path.dirname(args.json_path), "keynode", "task_01001.py")
+        if not os.path.exists(key_nodes_path):
+            print(f"[Skip task_{task_id}] No node code in {key_nodes_path}")
+            return None
+        with open(key_nodes_path,"r") as f:
+            key_nodes = f.read()
+        pipeline = DataflowPipeline(
+            save_path=checkpoint,
+            key_nodes=key_nodes,
+            use_claude=args.use_claude,
+            task_id=task_id,
+            run_id=run_id
+        )
+    elif inference_engine_name == 'declarative':
+        key_nodes_path = task_info.get('keynode')
+        print(key_nodes_path)
+        if not key_nodes_path:
+            key_nodes_path = os.path.join(os.path.dirname(args.json_path), "keynode", "task_01001.py")
+        key_nodes  = ""
+        if isinstance(key_nodes_path, list): # For comfybench-complex
+            for path in key_nodes_path:
+                if not os.path.exists(path):
+                    print(f"[Skip task_{task_id}] No node code in {path}")
+                    continue
+                with open(path, "r") as f:
+                    key_nodes += f.read() + "\n\n"
+            key_nodes = key_nodes.replace("# create nodes by instantiation", "[PLACEHOLDER]", 1) # remain first comment
+            key_nodes = key_nodes.replace("# create nodes by instantiation", "")
+            key_nodes = key_nodes.replace("[PLACEHOLDER]", "# create nodes by instantiation", 1)
+            
+        elif isinstance(key_nodes_path, str):
+            if not os.path.exists(key_nodes_path):
+                # key_nodes = ""
+                absolute_path = os.path.abspath(key_nodes_path)
+                print(f"[Skip task_{task_id}] No node code in {absolute_path}")
+                return None
+            with open(key_nodes_path, "r") as f:
+                key_nodes = f.read()
+        else:
+            print(f"[Skip task_{task_id}] Invalid keynode type: {type(key_nodes_path)}")
+            return None
+        pipeline = DeclarativePipeline(
+            save_path=checkpoint,
+            key_nodes=key_nodes,
+            use_claude=args.use_claude,
+            task_id=task_id,
+            run_id=run_id
+        )
+    elif inference_engine_name == 'pseudo_natural':
+        key_nodes_path = task_info.get('keynode')
+        if not key_nodes_path:
+            key_nodes_path = os.path.join(os.path.dirname(args.json_path), "keynode", "task_01001.py")
+        if not os.path.exists(key_nodes_path):
+            print(f"[Skip task_{task_id}] No node code in {key_nodes_path}")
+            return None
+        with open(key_nodes_path,"r") as f:
+            key_nodes = f.read()
+        pipeline = PseudoNaturalPipeline(
+            save_path=checkpoint,
+            key_nodes=key_nodes,
+            use_claude=args.use_claude,
+            task_id=task_id,
+            run_id=run_id
+        )
+    elif inference_engine_name == 'onestep':
+        key_nodes_path = task_info.get('keynode_path')
+        if not key_nodes_path:
+            key_nodes_path = os.path.join(os.path.dirname(args.json_path), "keynode", "task_01001.py")
+        key_nodes  = ""
+        if isinstance(key_nodes_path, list): # For comfybench-complex
+            for path in key_nodes_path:
+                if not os.path.exists(path):
+                    print(f"[Skip task_{task_id}] No node code in {path}")
+                    continue
+                with open(path, "r") as f:
+                    key_nodes += f.read() + "\n\n"
+            key_nodes = key_nodes.replace("# create nodes by instantiation", "[PLACEHOLDER]", 1) # remain first comment
+            key_nodes = key_nodes.replace("# create nodes by instantiation", "")
+            key_nodes = key_nodes.replace("[PLACEHOLDER]", "# create nodes by instantiation", 1)
+            
+        elif isinstance(key_nodes_path, str):
+            if not os.path.exists(key_nodes_path):
+                print(f"[Skip task_{task_id}] No node code in {key_nodes_path}")
+                return None
+            with open(key_nodes_path, "r") as f:
+                key_nodes = f.read()
+        else:
+            print(f"[Skip task_{task_id}] Invalid keynode type: {type(key_nodes_path)}")
+            return None
+        pipeline = OneStepPipeline(
+            save_path=checkpoint,
+            key_nodes=key_nodes,
+            use_claude=args.use_claude,
+            task_id=task_id,
+            run_id=run_id
+        )
+    else:
+        print(f'[Skip task_{task_id}] Unknown inference engine: {inference_engine_name}')
+        return None
+    pipeline.independent_sampling = args.independent_sampling
+    return pipeline
+
+
+def write_status(checkpoint, status):
+    with open(os.path.join(checkpoint, STATUS_FILE), 'w') as status_file:
+        status_file.write(f'{status}\n')
+
+
+def is_inferred(checkpoint):
+    # Runs that were interrupted (or raised) are still marked as running.
+    # Checkpoints from before the status file have only run.log, which was
+    # their mark of a finished run.
+    status_path = os.path.join(checkpoint, STATUS_FILE)
+    if not os.path.exists(status_path):
+        return os.path.exists(os.path.join(checkpoint, 'run.log'))
+    with open(status_path, 'r') as status_file:
+        return status_file.read().strip() != 'running'
+
+
+def mark_done(pipeline, workflow):
+    write_status(pipeline.save_path, 'succeeded' if workflow is not None else 'failed')
+
+
+def run_pipeline(pipeline, query):
+    try:
+        workflow = pipeline(query)
+        mark_done(pipeline, workflow)
+    except Exception as error:
+        print(error)
+        workflow = None
+
+    # Check: pipeline status
+    if workflow is None:
+        print(f'done: pipeline failed')
+    else:
+        print(f'done: pipeline succeeded')
+
+
+async def arun_pipeline(pipeline, query, semaphore):
+    async with semaphore:
+        try:
+            workflow = await pipeline.acall(query)
+            mark_done(pipeline, workflow)
+        except Exception as error:
+            print(error)
+            workflow = None
+
+    # Check: pipeline status
+    if workflow is None:
+        print(f'done: pipeline failed ({pipeline.save_path})')
+    else:
+        print(f'done: pipeline succeeded ({pipeline.save_path})')
+
+
+async def arun_pipelines(jobs, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*[
+        arun_pipeline(pipeline, query, semaphore)
+        for pipeline, query in jobs
+    ])
+
+
 def main(args):
     with open(args.json_path, 'r') as file:
         metadata = yaml.load(file, Loader=yaml.FullLoader)
     print(args.inference_engine_name)
+    ledger.path = args.ledger_path or ledger.path or f'{args.save_path}/ledger.jsonl'
+    print(f'[Inference] ledger {ledger.path}')
+    # Load the embedding model, the reference index, the rendered
+    # references and the node doc index once for all runs
+    warmup()
+    get_bundle()
+    get_node_doc_index()
+    jobs = []
     for inference_engine_name in args.inference_engine_name:
         print(f'[Inference] inference_engine {inference_engine_name}')
 
@@ -35,115 +219,46 @@ def main(args):
                 print(f'[Inference] run {run_id}/{args.num_runs}')
 
                 # Skip: already inferred
-                log_path = os.path.join(checkpoint, 'run.log')
-                if not args.force_run and os.path.exists(log_path):
+                if not args.force_run and is_inferred(checkpoint):
                     print('skipped: already inferred')
                     continue
+                # Marked before the pipeline creates run.log, so a run that
+                # does not finish is picked up again
+                write_status(checkpoint, 'running')
                 
                 # Create pipeline
-                elif inference_engine_name == 'dataflow':
-                    key_nodes_path = task_info.get('keynode')
-                    if not key_nodes_path:
-                        key_nodes_path = os.path.join(os.path.dirname(args.json_path), "keynode", "task_01001.py")
-                    if not os.path.exists(key_nodes_path):
-                        print(f"[Skip task_{task_id}] No node code in {key_nodes_path}")
-                        continue
-                    with open(key_nodes_path,"r") as f:
-                        key_nodes = f.read()
-                    pipeline = DataflowPipeline(
-                        save_path=checkpoint,
-                        key_nodes=key_nodes,
-                        use_claude=args.use_claude 
-                    )
-                elif inference_engine_name == 'declarative':
-                    key_nodes_path = task_info.get('keynode')
-                    print(key_nodes_path)
-                    if not key_nodes_path:
-                        key_nodes_path = os.path.join(os.path.dirname(args.json_path), "keynode", "task_01001.py")
-                    key_nodes  = ""
-                    if isinstance(key_nodes_path, list): # For comfybench-complex
-                        for path in key_nodes_path:
-                            if not os.path.exists(path):
-                                print(f"[Skip task_{task_id}] No node code in {path}")
-                                continue
-                            with open(path, "r") as f:
-                                key_nodes += f.read() + "\n\n"
-                        key_nodes = key_nodes.replace("# create nodes by instantiation", "[PLACEHOLDER]", 1) # remain first comment
-                        key_nodes = key_nodes.replace("# create nodes by instantiation", "")
-                        key_nodes = key_nodes.replace("[PLACEHOLDER]", "# create nodes by instantiation", 1)
-                        
-                    elif isinstance(key_nodes_path, str):
-                        if not os.path.exists(key_nodes_path):
-                            # key_nodes = ""
-                            absolute_path = os.path.abspath(key_nodes_path)
-                            print(f"[Skip task_{task_id}] No node code in {absolute_path}")
-                            continue
-                        with open(key_nodes_path, "r") as f:
-                            key_nodes = f.read()
-                    else:
-                        print(f"[Skip task_{task_id}] Invalid keynode type: {type(key_nodes_path)}")
-                        continue
-                    pipeline = DeclarativePipeline(
-                        save_path=checkpoint,
-                        key_nodes=key_nodes,
-                        use_claude=args.use_claude 
-                    )
-                elif inference_engine_name == 'pseudo_natural':
-                    key_nodes_path = task_info.get('keynode')
-                    if not key_nodes_path:
-                        key_nodes_path = os.path.join(os.path.dirname(args.json_path), "keynode", "task_01001.py")
-                    if not os.path.exists(key_nodes_path):
-                        print(f"[Skip task_{task_id}] No node code in {key_nodes_path}")
-                        continue
-                    with open(key_nodes_path,"r") as f:
-                        key_nodes = f.read()
-                    pipeline = PseudoNaturalPipeline(
-                        save_path=checkpoint,
-                        key_nodes=key_nodes,
-                        use_claude=args.use_claude 
-                    )
-                elif inference_engine_name == 'onestep':
-                    key_nodes_path = task_info.get('keynode_path')
-                    if not key_nodes_path:
-                        key_nodes_path = os.path.join(os.path.dirname(args.json_path), "keynode", "task_01001.py")
-                    key_nodes  = ""
-                    if isinstance(key_nodes_path, list): # For comfybench-complex
-                        for path in key_nodes_path:
-                            if not os.path.exists(path):
-                                print(f"[Skip task_{task_id}] No node code in {path}")
-                                continue
-                            with open(path, "r") as f:
-                                key_nodes += f.read() + "\n\n"
-                        key_nodes = key_nodes.replace("# create nodes by instantiation", "[PLACEHOLDER]", 1) # remain first comment
-                        key_nodes = key_nodes.replace("# create nodes by instantiation", "")
-                        key_nodes = key_nodes.replace("[PLACEHOLDER]", "# create nodes by instantiation", 1)
-                        
-                    elif isinstance(key_nodes_path, str):
-                        if not os.path.exists(key_nodes_path):
-                            print(f"[Skip task_{task_id}] No node code in {key_nodes_path}")
-                            continue
-                        with open(key_nodes_path, "r") as f:
-                            key_nodes = f.read()
-                    else:
-                        print(f"[Skip task_{task_id}] Invalid keynode type: {type(key_nodes_path)}")
-                        continue
-                    pipeline = OneStepPipeline(
-                        save_path=checkpoint,
-                        key_nodes=key_nodes,
-                        use_claude=args.use_claude 
-                    )
+                pipeline = build_pipeline(inference_engine_name, task_id, task_info, run_id, checkpoint, args)
+                if pipeline is None:
+                    continue
+
                 # Run pipeline
-                try:
-                    workflow = pipeline(query)
-                except Exception as error:
-                    print(error)
-                    workflow = None
+                if args.batch or args.concurrency > 1:
+                    jobs.append((pipeline, query))
+                    continue
+                run_pipeline(pipeline, query)
+
+    # Run queued pipelines stage by stage through the Batch API
+    if jobs and args.batch:
+        batch_path = args.batch_path or BATCH_PATH or f'{args.save_path}/batches'
+        print(f'[Inference] running {len(jobs)} pipelines as batches in {batch_path}')
+        results = run_batch(jobs, batch_path, use_claude=args.use_claude, workers=args.concurrency)
+        for pipeline, workflow, error in results:
+            if error is not None:
+                print(error)
+            else:
+                mark_done(pipeline, workflow)
+            if workflow is None:
+                print(f'done: pipeline failed ({pipeline.save_path})')
+            else:
+                print(f'done: pipeline succeeded ({pipeline.save_path})')
+
+    # Run queued pipelines concurrently on one event loop
+    elif jobs:
+        print(f'[Inference] running {len(jobs)} pipelines with concurrency {args.concurrency}')
+        asyncio.run(arun_pipelines(jobs, args.concurrency))
 
-                # Check: pipeline status
-                if workflow is None:
-                    print(f'done: pipeline failed')
-                else:
-                    print(f'done: pipeline succeeded')
+    for report in embedding_reports():
+        print(report)
 
 
 if __name__ == '__main__':
@@ -188,6 +303,31 @@ if __name__ == '__main__':
         action='store_true',
         default=False
     )
+    parser.add_argument(
+        '--concurrency',
+        default=1,
+        type=int
+    )
+    parser.add_argument(
+        '--independent_sampling',
+        action='store_true',
+        default=False
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        default=False
+    )
+    parser.add_argument(
+        '--batch_path',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--ledger_path',
+        default=None,
+        type=str
+    )
     parser.add_argument(
         '--json_path',
         type=str,
@@ -4,26 +4,13 @@ from inference_engine.dataflow.utils.function import safe_extract_from_soup
 import re
 import os
 
-adapter_prompt = '''
+adapter_prefix = '''
 ## Task
 
 ComfyUI uses workflows to create and execute Stable Diffusion pipelines so that users can design their own workflows to generate highly customized artworks.
 ComfyUI provides many nodes. Each node represents a module in the pipeline. Users can formulate a workflow into Python code by instantiating nodes and invoking them for execution.
 You are an expert in ComfyUI who helps users to design their own workflows.
 
-Now, you are provided a Workspace containing the code of nodes and required to create a **complete and correct** ComfyUI workflow by linking the nodes to finish the following task:
-
-{query}
-
-## Workspace
-
-*Note that brackets of nodes are represented by words of their names in codelines (e.g. LeftBracketComfy3DRightBracket_TripoSR represent the node [Comfy3D] TripoSR), so you need to be careful to match them with the corresponding node knowledge.
-The code and node knowledge of the current node instantiation code you are working on are presented as follows:
-
-{node_code}
-
-{node_knowledge}
-
 ## Link
 
 Based on the current nodes and their corresponding knowledge, you should link the nodes together.
@@ -77,6 +64,21 @@ First, you should provide your Python code to formulate the updated workflow. Yo
 After that, you should provide a brief description of the updated workflow and the expected effects as in the example.
 Your description should be enclosed with "<description>" tag. For example: <description> This workflow uses the text-to-image pipeline together with an upscaling module to generate a high-resolution image of a running horse. </description>.
 
+'''
+
+adapter_prompt = '''Now, you are provided a Workspace containing the code of nodes and required to create a **complete and correct** ComfyUI workflow by linking the nodes to finish the following task:
+
+{query}
+
+## Workspace
+
+*Note that brackets of nodes are represented by words of their names in codelines (e.g. LeftBracketComfy3DRightBracket_TripoSR represent the node [Comfy3D] TripoSR), so you need to be careful to match them with the corresponding node knowledge.
+The code and node knowledge of the current node instantiation code you are working on are presented as follows:
+
+{node_code}
+
+{node_knowledge}
+
 Now, provide your code and description with the required format.
 '''
 
@@ -115,7 +117,7 @@ def get_linker_inference_engine_prompt(query, node_code):
     node_code = f'<code>\n{node_code}\n</code>\n\n'
     node_knowledge = get_node_knowledge(node_code)
     
-    prompt_text = adapter_prompt.format(
+    prompt_text = adapter_prefix + adapter_prompt.format(
         query=query_content,
         node_code=node_code,
         node_knowledge=node_knowledge,
@@ -4,7 +4,7 @@ from inference_engine.declarative.utils.function import safe_extract_from_soup
 import re
 import os
 
-adapter_prompt = '''
+adapter_prefix = '''
 ## Task
 
 ComfyUI uses workflows to create and execute Stable Diffusion pipelines so that users can design their own workflows to generate highly customized artworks.
@@ -16,7 +16,7 @@ You are an expert in ComfyUI who helps users to design their own workflows.
 <introduction>
 In ComfyUI workflows, the complete pipeline is built in three stages: `add`, `invoke`, and `link`. Each stage has specific responsibilities.
 
-1. Add Node: In this stage, all nodes are instantiated and added to the workflow. This step defines the type of each node and specifies its parameters, such as input images, model checkpoints, or text prompts. The key requirement is that each node must have a unique ID, a node type, and a valid parameter dictionary. Example: `workflow.add_node("cliptextencode_2", "CLIPTextEncode", {{"text": "a beautiful scenery"}})`.
+1. Add Node: In this stage, all nodes are instantiated and added to the workflow. This step defines the type of each node and specifies its parameters, such as input images, model checkpoints, or text prompts. The key requirement is that each node must have a unique ID, a node type, and a valid parameter dictionary. Example: `workflow.add_node("cliptextencode_2", "CLIPTextEncode", {"text": "a beautiful scenery"})`.
 
 2. Invoke Node: In this stage, the added nodes are executed to perform their computations and produce outputs. The main purpose of invoking nodes is to generate the necessary outputs (e.g., image embeddings, latent variables) that will be used in subsequent stages of the workflow. Each node must be invoked only once. If the same function needs to be reused, a new instance of the node should be created and then invoked. The input variables provided must match the expected input ports of the node to ensure successful execution. Example: workflow.invoke_node(["positive_2"], "cliptextencode_2").
 
@@ -26,18 +26,6 @@ These three stages must be executed in order. First, `add_node` initializes all
 
 </introduciton>
 
-Now, you are provided a Workspace containing the code of nodes and required to create a **complete and correct** ComfyUI workflow by linking the nodes to finish the following task:
-
-{query}
-
-## Workspace
-
-The code and node knowledge of the current node instantiation code you are working on are presented as follows:
-
-{node_code}
-
-{node_knowledge}
-
 ## Link
 
 Based on the current nodes and their corresponding knowledge, you should link the nodes together. You should focus on the task requirements, consider function of each node and the expected effects when linking.
@@ -47,17 +35,17 @@ When processing `Invoke Node` part, you should invoke all the *outputs* of a nod
 For example, if here are the codes in the workflow :
 <code> 
 # Add Node
-workflow.add_node("vaeencodeforinpaint_12", "VAEEncodeForInpaint", {{"grow_mask_by": 16}})
-workflow.add_node("checkpointloadersimple_4", "CheckpointLoaderSimple", {{"ckpt_name": 'dreamshaper_8.safetensors'}})
-workflow.add_node("vaeloader_70", "VAELoader", {{"vae_name": 'vae-ft-mse-840000-ema-pruned.safetensors'}})
-workflow.add_node("checkpointloadersimple_25", "CheckpointLoaderSimple", {{"ckpt_name": 'dreamshaper_8Inpainting.safetensors'}})
-workflow.add_node("loadimage_78", "LoadImage", {{"image": 'iceberg.jpg'}})
-workflow.add_node("cliptextencode_7", "CLIPTextEncode", {{"text": 'illustration, painting, text, watermark, copyright, signature, notes'}})
-workflow.add_node("ksampler_21", "KSampler", {{"seed": 1, "control_after_generate": 'fixed', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1}})
-workflow.add_node("imagepadforoutpaint_11", "ImagePadForOutpaint", {{"left": 256, "top": 0, "right": 256, "bottom": 0, "feathering": 0}})
-workflow.add_node("cliptextencode_6", "CLIPTextEncode", {{"text": 'an image of iceberg'}})
-workflow.add_node("saveimage_79", "SaveImage", {{"filename_prefix": 'ComfyUI'}})
-workflow.add_node("vaedecode_23", "VAEDecode", {{}})
+workflow.add_node("vaeencodeforinpaint_12", "VAEEncodeForInpaint", {"grow_mask_by": 16})
+workflow.add_node("checkpointloadersimple_4", "CheckpointLoaderSimple", {"ckpt_name": 'dreamshaper_8.safetensors'})
+workflow.add_node("vaeloader_70", "VAELoader", {"vae_name": 'vae-ft-mse-840000-ema-pruned.safetensors'})
+workflow.add_node("checkpointloadersimple_25", "CheckpointLoaderSimple", {"ckpt_name": 'dreamshaper_8Inpainting.safetensors'})
+workflow.add_node("loadimage_78", "LoadImage", {"image": 'iceberg.jpg'})
+workflow.add_node("cliptextencode_7", "CLIPTextEncode", {"text": 'illustration, painting, text, watermark, copyright, signature, notes'})
+workflow.add_node("ksampler_21", "KSampler", {"seed": 1, "control_after_generate": 'fixed', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1})
+workflow.add_node("imagepadforoutpaint_11", "ImagePadForOutpaint", {"left": 256, "top": 0, "right": 256, "bottom": 0, "feathering": 0})
+workflow.add_node("cliptextencode_6", "CLIPTextEncode", {"text": 'an image of iceberg'})
+workflow.add_node("saveimage_79", "SaveImage", {"filename_prefix": 'ComfyUI'})
+workflow.add_node("vaedecode_23", "VAEDecode", {})
 
 # Invoke Node
 
@@ -123,19 +111,33 @@ First, you should provide your Python code to formulate the updated workflow. Yo
 
 * Your output code should be enclosed by <code> tag, for example: 
 <code>
-workflow.add_node("cliptextencode_7", "CLIPTextEncode", {{"text": "an image of iceberg"}})
+workflow.add_node("cliptextencode_7", "CLIPTextEncode", {"text": "an image of iceberg"})
 workflow.invoke_node(["conditioning_7"], "cliptextencode_7")
 workflow.connect("conditioning_7", "ksampler_21", "positive")
 </code>
 
 *Make sure Do not include comments or explanations about your actions within the code block.
 *Make sure your output code adds, invokes and links all nodes (including the saving node). The linked input and output ports must have matching types.
-*You should not leave any port unlinked, for example: for an added node:workflow.add_node("cliptextencode_2", "CLIPTextEncode", {{"text": 'a woman'}}), you should invoke it like<workflow.invoke_node(["conditioning_2"], "cliptextencode_2")> and link it like<workflow.connect("conditioning_2", "ksampler_3", "positive")><workflow.connect("clip_29", "cliptextencode_2", "clip")> 
+*You should not leave any port unlinked, for example: for an added node:workflow.add_node("cliptextencode_2", "CLIPTextEncode", {"text": 'a woman'}), you should invoke it like<workflow.invoke_node(["conditioning_2"], "cliptextencode_2")> and link it like<workflow.connect("conditioning_2", "ksampler_3", "positive")><workflow.connect("clip_29", "cliptextencode_2", "clip")> 
 workflow.connect("clip_29", "cliptextencode_2", "clip")
 
 After that, you should provide a brief description of the updated workflow and the expected effects as in the example.
 Your description should be enclosed with "<description>" tag. For example: <description> This workflow uses the text-to-image pipeline together with an upscaling module to generate a high-resolution image of a running horse. </description>.
 
+'''
+
+adapter_prompt = '''Now, you are provided a Workspace containing the code of nodes and required to create a **complete and correct** ComfyUI workflow by linking the nodes to finish the following task:
+
+{query}
+
+## Workspace
+
+The code and node knowledge of the current node instantiation code you are working on are presented as follows:
+
+{node_code}
+
+{node_knowledge}
+
 Now, provide your code and description with the required format.
 '''
 
@@ -172,7 +174,7 @@ def get_linker_inference_engine_prompt(query, node_code):
     node_code = f'<code>\n{node_code}\n</code>\n\n'
     node_knowledge = get_node_knowledge(node_code)
     
-    prompt_text = adapter_prompt.format(
+    prompt_text = adapter_prefix + adapter_prompt.format(
         query=query_content,
         node_code=node_code,
         node_knowledge=node_knowledge,
@@ -3,7 +3,7 @@ from bs4 import BeautifulSoup
 from inference_engine.declarative.utils.function import safe_extract_from_soup
 
 
-combiner_prompt = '''
+combiner_prefix = '''
 ## Task
 
 ComfyUI uses workflows to create and execute Stable Diffusion pipelines so that users can design their own workflows to generate highly customized artworks.
@@ -15,7 +15,7 @@ You are an expert in ComfyUI who helps users to instantiate their own workflows
 <introduction>
 In ComfyUI workflows, the complete pipeline is built in three stages: `add`, `invoke`, and `link`. Each stage has specific responsibilities.
 
-1. Add Node: In this stage, all nodes are instantiated and added to the workflow. This step defines the type of each node and specifies its parameters, such as input images, model checkpoints, or text prompts. The key requirement is that each node must have a unique ID, a node type, and a valid parameter dictionary. Example: `workflow.add_node("cliptextencode_2", "CLIPTextEncode", {{"text": "a beautiful scenery"}})`.
+1. Add Node: In this stage, all nodes are instantiated and added to the workflow. This step defines the type of each node and specifies its parameters, such as input images, model checkpoints, or text prompts. The key requirement is that each node must have a unique ID, a node type, and a valid parameter dictionary. Example: `workflow.add_node("cliptextencode_2", "CLIPTextEncode", {"text": "a beautiful scenery"})`.
 
 2. Invoke Node: In this stage, the added nodes are executed to perform their computations and produce outputs. The main purpose of invoking nodes is to generate the necessary outputs (e.g., image embeddings, latent variables) that will be used in subsequent stages of the workflow. Each node must be invoked only once. If the same function needs to be reused, a new instance of the node should be created and then invoked. The input variables provided must match the expected input ports of the node to ensure successful execution. Example: workflow.invoke_node(["positive_2"], "cliptextencode_2").
 
@@ -25,37 +25,6 @@ These three stages must be executed in order. First, `add_node` initializes all
 
 </introduciton>
 
-Now you are required to create a ComfyUI workflow to finish the following task:
-
-The user query is as follows:
-
-{query}
-
-The key points behind the requirements and the expected paradigm of the workflow are analyzed as follows:
-
-{analysis}
-
-## Reference
-
-The code and description of the example workflow you are referring to are presented as follows:
-
-{reference}
-
-## Key Nodes
-The user has provided the following key nodes that *must be included* in the workflow:
-
-{key_nodes}
-
-The corresponding knowledge for the key nodes is as follows:
-
-{key_node_knowledge}
-
-## Workspace
-
-The code of the current nodes instantiation you are working on are presented as follows:
-
-{code}
-
 ## Combination and Adaptation
 
 Following the current progress, the step-by-step plan is outlined as follows:
@@ -80,11 +49,11 @@ Please note that the K-sampler requires negative input, so make sure to have an
 6. Before your output your code, check the validity of all the parameters in node instantiation. You should fill the nodes in valid and sound texts/conditions/models/parameters that could work without any manual adjustment.
 7. Please note that the SVD_img2vid_Conditioning or StableZero123_Conditioning for image to video generation will directly provide the positive condition and the negative condition for Ksampler, so make sure there is no extra textencode node provided for the ksampler. (other tasks like text to video may not suitable)
 8. Please note that the ImageOnlyCheckpointLoader for image to video generation will provide model and vae which is enough for further steps, so make sure there is no extra node like CheckpointLoaderSimple that provide extra model and vae. (other tasks like text to video may not suitable)
-9. Please follow the standard format of node adding, the name shoud consists of node name and '_' followed by ** a number **, like this: workflow.add_node("vaedecode_23", "VAEDecode", {{}}). Check the nodes you add follow this format. For example, workflow.add_node("loadimage_beach", "LoadImage", {{"image": 'beach.png'}}) is wrong, while workflow.add_node("loadimage_1", "LoadImage", {{"image": 'beach.png'}}) is correct.
+9. Please follow the standard format of node adding, the name shoud consists of node name and '_' followed by ** a number **, like this: workflow.add_node("vaedecode_23", "VAEDecode", {}). Check the nodes you add follow this format. For example, workflow.add_node("loadimage_beach", "LoadImage", {"image": 'beach.png'}) is wrong, while workflow.add_node("loadimage_1", "LoadImage", {"image": 'beach.png'}) is correct.
 10. A query ask for video generation with no stated input is a text to video query. Note that in text to video task, you always need to include key words like 'significant perspective change' or explicity require large motion in your prompt.
 11. DO NOT SET VIDEO FRAMES MORE THAN 10, IT WILL CAUSE TIMEOUT ERROR. VIDEO SAMPLING STEP SHOULD BE LESS THAN 50 AND GREATER THAN 20 TO IMPROVE QUALITY.
 12. If you are required to generate a video (including upscale video frames), use SaveAnimatedWEBP as the lastest node to save the video. Also, remember 1.add 'cliploader' node to prepare the model for the cogvideo text encode. 2.add 'downloadandloadcogvideomodel' node to prepare for the model and vae.
-13. If you need to load video, use `VHS_LoadVideo` node. For example: workflow.add_node("vhs_loadvideo_1", "VHS_LoadVideo", {{"video": 'male_idol.mp4', "force_rate": 0, "force_size": 'Disabled', "custom_width": 512, "custom_height": 512, "frame_load_cap": 0, "skip_first_frames": 0, "select_every_nth": 1}})
+13. If you need to load video, use `VHS_LoadVideo` node. For example: workflow.add_node("vhs_loadvideo_1", "VHS_LoadVideo", {"video": 'male_idol.mp4', "force_rate": 0, "force_size": 'Disabled', "custom_width": 512, "custom_height": 512, "frame_load_cap": 0, "skip_first_frames": 0, "select_every_nth": 1})
 14. If your task is about loading a video and do something on it, i.e. modality is video-to-video, you can just use `VHS_LoadVideo` node to load this video and treat each frame's processing as an batched image-to-image task and finnaly use SaveAnimatedWEBP to save the video. You should not use CogVideoSampler node to process V2V tasks. (This means you can just replace the `load image` with `load video` and `save image` with `save video` nodes to adapt functions from image-to-image task to video-to-video task)
 15. Do not set *parameters initial value* (not port named `negative`, just the value) to negative value unless the node needs exactly or explicitly stated in the task description. For example, do not set `CR Overlay Text`'s position to a negative value.
 16. When you are adding prompt to remove/replace object, be specific and concise (3-7words)
@@ -93,22 +62,55 @@ Your code should be enclosed with "<code>" tag. This is an example for format on
 
 <code> 
 # Add Node
-workflow.add_node("vaeencodeforinpaint_12", "VAEEncodeForInpaint", {{"grow_mask_by": 16}})
-workflow.add_node("checkpointloadersimple_4", "CheckpointLoaderSimple", {{"ckpt_name": 'dreamshaper_8.safetensors'}})
-workflow.add_node("vaeloader_70", "VAELoader", {{"vae_name": 'vae-ft-mse-840000-ema-pruned.safetensors'}})
-workflow.add_node("checkpointloadersimple_25", "CheckpointLoaderSimple", {{"ckpt_name": 'dreamshaper_8Inpainting.safetensors'}})
-workflow.add_node("loadimage_78", "LoadImage", {{"image": 'iceberg.jpg'}})
-workflow.add_node("cliptextencode_7", "CLIPTextEncode", {{"text": 'illustration, painting, text, watermark, copyright, signature, notes'}})
-workflow.add_node("ksampler_21", "KSampler", {{"seed": 1, "control_after_generate": 'fixed', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1}})
-workflow.add_node("imagepadforoutpaint_11", "ImagePadForOutpaint", {{"left": 256, "top": 0, "right": 256, "bottom": 0, "feathering": 0}})
-workflow.add_node("cliptextencode_6", "CLIPTextEncode", {{"text": 'an image of iceberg'}})
-workflow.add_node("saveimage_79", "SaveImage", {{"filename_prefix": 'ComfyUI'}})
-workflow.add_node("vaedecode_23", "VAEDecode", {{}}) 
+workflow.add_node("vaeencodeforinpaint_12", "VAEEncodeForInpaint", {"grow_mask_by": 16})
+workflow.add_node("checkpointloadersimple_4", "CheckpointLoaderSimple", {"ckpt_name": 'dreamshaper_8.safetensors'})
+workflow.add_node("vaeloader_70", "VAELoader", {"vae_name": 'vae-ft-mse-840000-ema-pruned.safetensors'})
+workflow.add_node("checkpointloadersimple_25", "CheckpointLoaderSimple", {"ckpt_name": 'dreamshaper_8Inpainting.safetensors'})
+workflow.add_node("loadimage_78", "LoadImage", {"image": 'iceberg.jpg'})
+workflow.add_node("cliptextencode_7", "CLIPTextEncode", {"text": 'illustration, painting, text, watermark, copyright, signature, notes'})
+workflow.add_node("ksampler_21", "KSampler", {"seed": 1, "control_after_generate": 'fixed', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1})
+workflow.add_node("imagepadforoutpaint_11", "ImagePadForOutpaint", {"left": 256, "top": 0, "right": 256, "bottom": 0, "feathering": 0})
+workflow.add_node("cliptextencode_6", "CLIPTextEncode", {"text": 'an image of iceberg'})
+workflow.add_node("saveimage_79", "SaveImage", {"filename_prefix": 'ComfyUI'})
+workflow.add_node("vaedecode_23", "VAEDecode", {}) 
 </code>.
 
 After that, you should provide a brief description of the whole set of node instantiations and their intended roles in the workflow.
 Your description should be enclosed with "<description>" tag. For example: <description> Added an upscaling module to enhance image resolution. </description>.
 
+'''
+
+combiner_prompt = '''Now you are required to create a ComfyUI workflow to finish the following task:
+
+The user query is as follows:
+
+{query}
+
+The key points behind the requirements and the expected paradigm of the workflow are analyzed as follows:
+
+{analysis}
+
+## Reference
+
+The code and description of the example workflow you are referring to are presented as follows:
+
+{reference}
+
+## Key Nodes
+The user has provided the following key nodes that *must be included* in the workflow:
+
+{key_nodes}
+
+The corresponding knowledge for the key nodes is as follows:
+
+{key_node_knowledge}
+
+## Workspace
+
+The code of the current nodes instantiation you are working on are presented as follows:
+
+{code}
+
 Now, check that you don't miss any nodes in the user's keynodes, and provide your code and description with the required format (specifically, if this is a text to video, remember to add this: workflow.add_node("checkpointloadersimple_16", "CheckpointLoaderSimple", {{"ckpt_name": 'sd_xl_base_1.0.safetensors'}})).
 '''
 
@@ -122,7 +124,7 @@ def get_generator_inference_engine_prompt(
     key_node_knowledge:str
 ):
 
-    prompt_text = combiner_prompt.format(
+    prompt_text = combiner_prefix + combiner_prompt.format(
         code=f'<code>\n{code}\n</code>\n\n',
         query=query,
         analysis=analysis,
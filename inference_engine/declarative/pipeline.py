@@ -3,7 +3,10 @@ import logging
 import hashlib
 import os
 from utils.parser import parse_wfcode_to_workflow, parse_wfcode_to_code, parse_code_to_wfcode
-from utils.llm import retrieve_references, invoke_completion, invoke_completion_claude
+from utils.llm import get_completion_functions
+from utils.runner import StepPipeline
+from utils.reference_bundle import get_bundle
+from utils.node_docs import get_related_node_knowledge, NODE_DOCS_ANALYZER_COUNT
 from utils.comfy import execute_workflow
 
 from inference_engine.declarative.inference_engine.analyzer import get_analyzer_inference_engine_prompt, parse_analyzer_inference_engine_response
@@ -20,21 +23,28 @@ with open('./config.yaml', 'r') as file:
 USE_COMFYBENCH_WORKFLOW = config['use_comfybench_workflow']
 workspace = "workflow_comfybench" if USE_COMFYBENCH_WORKFLOW else "workflow"
 
-class DeclarativePipeline:
+class DeclarativePipeline(StepPipeline):
+    engine_name = 'declarative'
+    code_style = 'wfcode'
+
     def __init__(
         self,
         save_path: str,
         key_nodes: str,
         num_refs: int = 3,
         num_fixes: int = 3,
-        use_claude = False
+        use_claude = False,
+        task_id = None,
+        run_id = None
     ):
         self.save_path = save_path
+        self.task_id = task_id
+        self.run_id = run_id
         self.num_refs = num_refs
         self.num_fixes = num_fixes
         self.key_nodes = parse_code_to_wfcode(key_nodes)
         
-        self.invoke_completion = invoke_completion_claude if use_claude else invoke_completion
+        self.invoke_completion, self.ainvoke_completion = get_completion_functions(use_claude)
 
         logger_name = hashlib.md5(save_path.encode()).hexdigest()
         self.logger = logging.getLogger(logger_name)
@@ -54,7 +64,7 @@ class DeclarativePipeline:
         self.logger.addHandler(file_handler)
         self.logger.addHandler(console_handler)
 
-    def __call__(self, query_text: str):
+    def _steps(self, query_text: str):
         # Start pipeline
         self.logger.info('Pipeline started')
 
@@ -71,39 +81,26 @@ class DeclarativePipeline:
             query=query_text
         )
         self.logger.info(f'Input prompt:{analyzer_message}')
-        answer, usage = self.invoke_completion(analyzer_message)
+        answer, usage = yield 'analyzer', analyzer_message
         keyword, analysis = parse_analyzer_inference_engine_response(answer.content)
         self.logger.info(f'Generated answer:{answer.content}')
         self.logger.info(f'Selected keyword:{keyword}')
         self.logger.info(f'Token usage:{usage}')
 
-        references = retrieve_references(
-            requirement=analysis,
-            count=self.num_refs
-        )
+        references = yield 'retrieval', analysis
         self.logger.info('Retrieved references:')
         for reference in references:
             self.logger.info(f'  {reference.metadata["name"]}: {reference.page_content}')
 
         # Retrieve key node knowledge
         key_node_knowledge = get_node_knowledge(self.key_nodes)
+        key_node_knowledge += get_related_node_knowledge(analysis, self.key_nodes, NODE_DOCS_ANALYZER_COUNT)
         self.logger.info(f'Retrieved key node knowledge:{key_node_knowledge}')
 
-        with open(f'./dataset/{workspace}/meta.json') as meta_file:
-            metadata = json.load(meta_file)
-        
         # select ref by LLM
-        if keyword in metadata.keys():
-            path = metadata[keyword]
-            with open(path['code'], 'r') as code_file:
-                code = code_file.read()
-
-            with open(path['description'], 'r') as desc_file:
-                description = desc_file.read()
-        else:
-            code, description = "", ""
-        
-        code = parse_code_to_wfcode(code)
+        bundle = get_bundle(workspace)
+        code = bundle.code(keyword, self.code_style)
+        description = bundle.description(keyword)
         
         # Generate workflow nodes
         self.logger.info('Generate workflow nodes')
@@ -116,17 +113,7 @@ class DeclarativePipeline:
             
             # if ref.metadata["name"] == keyword: continue
             
-            reference += f'- Example: {ref.metadata["name"]}\n\n'
-            
-            with open(ref.metadata['code'], 'r') as code_file:
-                reference_code = code_file.read()
-            reference_code = parse_code_to_wfcode(reference_code)
-            reference += f'<code>\n{reference_code}\n</code>\n\n'
-            
-            with open(ref.metadata['description'], 'r') as desc_file:
-                reference_description = desc_file.read()
-            
-            reference += f'<description>\n{reference_description}\n</description>\n\n'
+            reference += bundle.block(ref.metadata["name"], self.code_style)
             
         self.logger.info(f'Reference: {reference}')
         
@@ -140,7 +127,7 @@ class DeclarativePipeline:
             key_node_knowledge=key_node_knowledge
         )
         self.logger.info(f'Input prompt:{generator_message}')
-        answer, usage = self.invoke_completion(generator_message)
+        answer, usage = yield 'generator', generator_message
         combiner_response = answer.content
         self.logger.info(f'Generated answer:{combiner_response}')
         self.logger.info(f'Token usage:{usage}')
@@ -156,7 +143,7 @@ class DeclarativePipeline:
         self.logger.info('Link nodes to generate complete workflow')
         linker_message = get_linker_inference_engine_prompt(query=query_text, node_code=code)
         self.logger.info(f'Input prompt for linker:{linker_message}')
-        answer, usage = self.invoke_completion(linker_message)
+        answer, usage = yield 'linker', linker_message
         linker_response = answer.content
         self.logger.info(f'Generated linker answer:{linker_response}')
         self.logger.info(f'Token usage:{usage}')
@@ -175,7 +162,7 @@ class DeclarativePipeline:
         except Exception as e:
             self.logger.error(f"Error parsing linker response: {str(e)}")
             self.logger.info('Entering refinement phase due to linker error')
-            self._run_refiner(query_text, code, description, str(e))
+            yield from self._run_refiner(query_text, code, description, str(e))
             return None
         
         self.logger.info(f'Parsed code:\n  {code}')
@@ -190,7 +177,7 @@ class DeclarativePipeline:
         except Exception as error:
             self.logger.error(f'Error parsing code to workflow: {str(error)}')
             self.logger.info('Entering refinement phase due to save error')
-            code, workflow = self._run_refiner(query_text, code, description, str(error), reference)
+            code, workflow = yield from self._run_refiner(query_text, code, description, str(error), reference)
         
         with open(f'{self.save_path}/code.py', 'w') as code_file:
             code_file.write(code)
@@ -205,7 +192,7 @@ class DeclarativePipeline:
         except Exception as error:
             self.logger.error(f'Error executing workflow: {str(error)}')
             self.logger.info('Entering refinement phase due to save error')
-            code, workflow = self._run_refiner(query_text, code, description, str(error), reference)
+            code, workflow = yield from self._run_refiner(query_text, code, description, str(error), reference)
             try: 
                 status, outputs = execute_workflow(workflow)
             except Exception as error:
@@ -246,7 +233,7 @@ class DeclarativePipeline:
                 reference=reference
             )
             self.logger.info(f'Input prompt for refiner:\n  {refiner_message}')
-            answer, usage = self.invoke_completion(refiner_message)
+            answer, usage = yield 'refiner', refiner_message
             refiner_response = answer.content
             self.logger.info(f'Generated refiner answer:\n  {refiner_response}')
             self.logger.info(f'Token usage: {usage}')
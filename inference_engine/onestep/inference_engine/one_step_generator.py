@@ -5,7 +5,7 @@ from inference_engine.onestep.utils.function import safe_extract_from_soup
 import os
 from utils.parser import parse_wfcode_to_code
 import re
-one_step_prompt = '''
+one_step_prefix = '''
 ## Task
 
 ComfyUI uses workflows to create and execute Stable Diffusion pipelines so that users can design their own workflows to generate highly customized artworks.
@@ -16,7 +16,7 @@ ComfyUI provides many nodes. Each node represents a module in the pipeline. User
 <introduction>
 In ComfyUI workflows, the complete pipeline is built in three stages: `add`, `invoke`, and `link`. Each stage has specific responsibilities.
 
-1. Add Node: In this stage, all nodes are instantiated and added to the workflow. This step defines the type of each node and specifies its parameters, such as input images, model checkpoints, or text prompts. The key requirement is that each node must have a unique ID, a node type, and a valid parameter dictionary. Example: `workflow.add_node("cliptextencode_2", "CLIPTextEncode", {{"text": "a beautiful scenery"}})`.
+1. Add Node: In this stage, all nodes are instantiated and added to the workflow. This step defines the type of each node and specifies its parameters, such as input images, model checkpoints, or text prompts. The key requirement is that each node must have a unique ID, a node type, and a valid parameter dictionary. Example: `workflow.add_node("cliptextencode_2", "CLIPTextEncode", {"text": "a beautiful scenery"})`.
 
 2. Invoke Node: In this stage, the added nodes are executed to perform their computations and produce outputs. The main purpose of invoking nodes is to generate the necessary outputs (e.g., image embeddings, latent variables) that will be used in subsequent stages of the workflow. Each node must be invoked only once. If the same function needs to be reused, a new instance of the node should be created and then invoked. The input variables provided must match the expected input ports of the node to ensure successful execution. Example: workflow.invoke_node(["positive_2"], "cliptextencode_2").
 
@@ -27,21 +27,6 @@ These three stages must be executed in order. First, `add_node` initializes all
 In this task, you will create a **complete ComfyUI workflow**, combining all three stages (`add`, `invoke`, and `link`) into one continuous process. The workflow must meet the user's requirements, ensuring all nodes are instantiated, invoked, and linked correctly. This ensures the generated workflow is functional, coherent, and meets the user’s input requirements.
 </introduciton>
 
-## User Query
-{query}
-
-## Workflow Analysis
-{analysis}
-
-## Key Nodes (MUST INCLUDE)
-{key_nodes}
-
-## Reference Workflows
-{reference}
-
-## Node Knowledge
-{key_node_knowledge}
-
 ## Add Node
 
 Following the current progress, the step-by-step plan is outlined as follows:
@@ -61,11 +46,11 @@ Other Requirements on Add Node:
 6. Before your output your code, check the validity of all the parameters in node instantiation. You should fill the nodes in valid and sound texts/conditions/models/parameters that could work without any manual adjustment.
 7. Please note that the SVD_img2vid_Conditioning or StableZero123_Conditioning for image to video generation will directly provide the positive condition and the negative condition for Ksampler, so make sure there is no extra textencode node provided for the ksampler. (other tasks like text to video may not suitable)
 8. Please note that the ImageOnlyCheckpointLoader for image to video generation will provide model and vae which is enough for further steps, so make sure there is no extra node like CheckpointLoaderSimple that provide extra model and vae. (other tasks like text to video may not suitable)
-9. Please follow the standard format of node adding, the name shoud consists of node name and '_' followed by ** a number **, like this: workflow.add_node("vaedecode_23", "VAEDecode", {{}}). Check the nodes you add follow this format. For example, workflow.add_node("loadimage_beach", "LoadImage", {{"image": 'beach.png'}}) is wrong, while workflow.add_node("loadimage_1", "LoadImage", {{"image": 'beach.png'}}) is correct.
+9. Please follow the standard format of node adding, the name shoud consists of node name and '_' followed by ** a number **, like this: workflow.add_node("vaedecode_23", "VAEDecode", {}). Check the nodes you add follow this format. For example, workflow.add_node("loadimage_beach", "LoadImage", {"image": 'beach.png'}) is wrong, while workflow.add_node("loadimage_1", "LoadImage", {"image": 'beach.png'}) is correct.
 10. A query ask for video generation with no stated input is a text to video query.
 11. DO NOT SET VIDEO FRAMES MORE THAN 10, IT WILL CAUSE TIMEOUT ERROR. VIDEO SAMPLING STEP SHOULD BE LESS THAN 50 AND GREATER THAN 20 TO IMPROVE QUALITY.
 12. If you are required to generate a video (including upscale video frames), use SaveAnimatedWEBP as the lastest node to save the video. Also, remember 1.add 'cliploader' node to prepare the model for the cogvideo text encode. 2.add 'downloadandloadcogvideomodel' node to prepare for the model and vae.
-13. If you need to load video, use `VHS_LoadVideo` node. For example: workflow.add_node("vhs_loadvideo_1", "VHS_LoadVideo", {{"video"='male_idol.mp4', "force_rate"=0, "force_size"='Disabled', "custom_width"=512, "custom_height"=512, frame_load_cap=0, skip_first_frames=0, select_every_nth=1}})
+13. If you need to load video, use `VHS_LoadVideo` node. For example: workflow.add_node("vhs_loadvideo_1", "VHS_LoadVideo", {"video"='male_idol.mp4', "force_rate"=0, "force_size"='Disabled', "custom_width"=512, "custom_height"=512, frame_load_cap=0, skip_first_frames=0, select_every_nth=1})
 14. If your task is about loading a video and do something on it, i.e. modality is video-to-video, you can just use `VHS_LoadVideo` node to load this video and treat each frame's processing as an batched image-to-image task and finnaly use SaveAnimatedWEBP to save the video. You should not use CogVideoSampler node to process V2V tasks. (This means you can just replace the `load image` with `load video` and `save image` with `save video` nodes to adapt functions from image-to-image task to video-to-video task)
 15. Do not set *parameters initial value* (not port named `negative`, just the value) to negative value unless the node needs exactly or explicitly stated in the task description. For example, do not set `CR Overlay Text`'s position to a negative value.
 
@@ -109,17 +94,17 @@ Your code should be enclosed with "<code>" tag. *This is an example for format o
 
 <code> 
 # Add Node
-workflow.add_node("vaeencodeforinpaint_12", "VAEEncodeForInpaint", {{"grow_mask_by": 16}})
-workflow.add_node("checkpointloadersimple_4", "CheckpointLoaderSimple", {{"ckpt_name": 'dreamshaper_8.safetensors'}})
-workflow.add_node("vaeloader_70", "VAELoader", {{"vae_name": 'vae-ft-mse-840000-ema-pruned.safetensors'}})
-workflow.add_node("checkpointloadersimple_25", "CheckpointLoaderSimple", {{"ckpt_name": 'dreamshaper_8Inpainting.safetensors'}})
-workflow.add_node("loadimage_78", "LoadImage", {{"image": 'iceberg.jpg'}})
-workflow.add_node("cliptextencode_7", "CLIPTextEncode", {{"text": 'illustration, painting, text, watermark, copyright, signature, notes'}})
-workflow.add_node("ksampler_21", "KSampler", {{"seed": 1, "control_after_generate": 'fixed', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1}})
-workflow.add_node("imagepadforoutpaint_11", "ImagePadForOutpaint", {{"left": 256, "top": 0, "right": 256, "bottom": 0, "feathering": 0}})
-workflow.add_node("cliptextencode_6", "CLIPTextEncode", {{"text": 'an image of iceberg'}})
-workflow.add_node("saveimage_79", "SaveImage", {{"filename_prefix": 'ComfyUI'}})
-workflow.add_node("vaedecode_23", "VAEDecode", {{}})
+workflow.add_node("vaeencodeforinpaint_12", "VAEEncodeForInpaint", {"grow_mask_by": 16})
+workflow.add_node("checkpointloadersimple_4", "CheckpointLoaderSimple", {"ckpt_name": 'dreamshaper_8.safetensors'})
+workflow.add_node("vaeloader_70", "VAELoader", {"vae_name": 'vae-ft-mse-840000-ema-pruned.safetensors'})
+workflow.add_node("checkpointloadersimple_25", "CheckpointLoaderSimple", {"ckpt_name": 'dreamshaper_8Inpainting.safetensors'})
+workflow.add_node("loadimage_78", "LoadImage", {"image": 'iceberg.jpg'})
+workflow.add_node("cliptextencode_7", "CLIPTextEncode", {"text": 'illustration, painting, text, watermark, copyright, signature, notes'})
+workflow.add_node("ksampler_21", "KSampler", {"seed": 1, "control_after_generate": 'fixed', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1})
+workflow.add_node("imagepadforoutpaint_11", "ImagePadForOutpaint", {"left": 256, "top": 0, "right": 256, "bottom": 0, "feathering": 0})
+workflow.add_node("cliptextencode_6", "CLIPTextEncode", {"text": 'an image of iceberg'})
+workflow.add_node("saveimage_79", "SaveImage", {"filename_prefix": 'ComfyUI'})
+workflow.add_node("vaedecode_23", "VAEDecode", {})
 
 # Invoke Node
 workflow.invoke_node(["model_4", "clip_4", "vae_4"], "checkpointloadersimple_4")
@@ -152,6 +137,23 @@ workflow.connect("image_23", "saveimage_79", "images")
 
 After that, you should provide a brief description of the whole set of node instantiations and their intended roles in the workflow.
 Your description should be enclosed with "<description>" tag. For example: <description> Added an upscaling module to enhance image resolution. </description>.
+
+'''
+
+one_step_prompt = '''## User Query
+{query}
+
+## Workflow Analysis
+{analysis}
+
+## Key Nodes (MUST INCLUDE)
+{key_nodes}
+
+## Reference Workflows
+{reference}
+
+## Node Knowledge
+{key_node_knowledge}
 '''
 
 def get_one_step_generator_prompt(
@@ -161,7 +163,7 @@ def get_one_step_generator_prompt(
     reference: str,
     key_node_knowledge: str
 ):
-    prompt_text = one_step_prompt.format(
+    prompt_text = one_step_prefix + one_step_prompt.format(
         query=query,
         analysis=analysis,
         key_nodes=f'<key_nodes>\n{key_nodes}\n</key_nodes>',
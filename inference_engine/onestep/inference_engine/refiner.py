@@ -2,9 +2,10 @@ from bs4 import BeautifulSoup
 
 from inference_engine.onestep.utils.function import safe_extract_from_soup
 # from inference_engine.onestep.inference_engine.linker import get_node_knowledge
+from utils.node_docs import get_related_node_knowledge, NODE_DOCS_REFINER_COUNT
 
 
-refiner_prompt = '''
+refiner_prefix = '''
 ## Task
 
 ComfyUI uses workflows to create and execute Stable Diffusion pipelines so that users can design their own workflows to generate highly customized artworks.
@@ -16,7 +17,7 @@ You are an expert in ComfyUI who helps users to design their own workflows.
 <introduction>
 In ComfyUI workflows, the complete pipeline is built in three stages: `add`, `invoke`, and `link`. Each stage has specific responsibilities.
 
-1. Add Node: In this stage, all nodes are instantiated and added to the workflow. This step defines the type of each node and specifies its parameters, such as input images, model checkpoints, or text prompts. The key requirement is that each node must have a unique ID, a node type, and a valid parameter dictionary. Example: `workflow.add_node("cliptextencode_2", "CLIPTextEncode", {{"text": "a beautiful scenery"}})`.
+1. Add Node: In this stage, all nodes are instantiated and added to the workflow. This step defines the type of each node and specifies its parameters, such as input images, model checkpoints, or text prompts. The key requirement is that each node must have a unique ID, a node type, and a valid parameter dictionary. Example: `workflow.add_node("cliptextencode_2", "CLIPTextEncode", {"text": "a beautiful scenery"})`.
 
 2. Invoke Node: In this stage, the added nodes are executed to perform their computations and produce outputs. The main purpose of invoking nodes is to generate the necessary outputs (e.g., image embeddings, latent variables) that will be used in subsequent stages of the workflow. Each node must be invoked only once. If the same function needs to be reused, a new instance of the node should be created and then invoked. The input variables provided must match the expected input ports of the node to ensure successful execution. Example: workflow.invoke_node(["positive_2"], "cliptextencode_2").
 
@@ -26,37 +27,6 @@ These three stages must be executed in order. First, `add_node` initializes all
 
 </introduciton>
 
-
-Now, you are provided with a partially constructed workflow. Your task is to refine the current workflow by fixing any errors and completing it to ensure it functions as expected. You should also check the type of the connection according to the node knowledge.
-
-The user query is as follows:
-
-{query}
-
-## Workspace
-
-The code and description of the current workflow you are working on is presented as follows:
-
-{workspace}
-
-## Nodes knowledge
-
-The corresponding knowledge for the nodes in current workflow is as follows:
-
-{node_knowledge}
-
-## Reference
-
-The code and description of the example workflow you are referring to are presented as follows:
-
-{reference}
-
-## Refinement
-
-However, an error occurred when running your code. This may be caused by missing nodes, incorrect parameter values, or incorrect connections between nodes. The detailed error message is presented as follows:
-
-{refinement}
-
 ## Refinement Examples
 
 Here are some examples of how to fix some common errors of invalid code. Each example has the relevant infomation about the codes.
@@ -64,8 +34,8 @@ You should learn from the analysis and solution of each example and try to fix t
 
 <example1>
 # Add Node
-workflow.add_node("loadimage_3", "LoadImage", {{"image": 'president_trump.jpg'}})
-workflow.add_node("ksampler_1", "KSampler", {{"seed": 249584040731174, "control_after_generate": 'randomize', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1}})
+workflow.add_node("loadimage_3", "LoadImage", {"image": 'president_trump.jpg'})
+workflow.add_node("ksampler_1", "KSampler", {"seed": 249584040731174, "control_after_generate": 'randomize', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1})
 
 # Invoke Node
 workflow.invoke_node(["image_3", "mask_3"], "loadimage_3")
@@ -84,9 +54,9 @@ Solution 2: Search for required nodes from the reference to provide latent_image
 
 Here are the relevant refined code:
 # Add Node
-workflow.add_node("loadimage_3", "LoadImage", {{"image": 'president_trump.jpg'}})
-workflow.add_node("ksampler_1", "KSampler", {{"seed": 249584040731174, "control_after_generate": 'randomize', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1}})
-workflow.add_node("emptylatentimage_5", "EmptyLatentImage", {{"width": 512, "height": 512, "batch_size": 1}})
+workflow.add_node("loadimage_3", "LoadImage", {"image": 'president_trump.jpg'})
+workflow.add_node("ksampler_1", "KSampler", {"seed": 249584040731174, "control_after_generate": 'randomize', "steps": 20, "cfg": 7, "sampler_name": 'dpmpp_2m', "scheduler": 'karras', "denoise": 1})
+workflow.add_node("emptylatentimage_5", "EmptyLatentImage", {"width": 512, "height": 512, "batch_size": 1})
 
 # Invoke Node
 workflow.invoke_node(["latentimage_5"], "emptylatentimage_5")
@@ -99,11 +69,11 @@ workflow.connect("latentimage_5", "ksampler_1", "latent_image")
 
 <example2>
 # Add Node
-workflow.add_node("cliptextencode_9", "CLIPTextEncode", {{"text": '(realistic, high-quality:1.2)'}})
-workflow.add_node("cliptextencode_10", "CLIPTextEncode", {{"text": '(low-quality, blurred:1.2)'}})
-workflow.add_node("svd_img2vid_conditioning_3", "SVD_img2vid_Conditioning", {{"width": 1024, "height": 576, "video_frames": 24, "motion_bucket_id": 100, "fps": 6, "augmentation_level": 0}})
-workflow.add_node("ksampleradvanced_7", "KSamplerAdvanced", {{"add_noise": 'enable', "noise_seed": 49770757027309, "control_after_generate": 'fixed', "steps": 20, "cfg": 2.52, "sampler_name": 'euler', "scheduler": 'ddim_uniform', "start_at_step": 0, "end_at_step": 10000, "return_with_leftover_noise": 'disable'}})
-workflow.add_node("imageonlycheckpointloader_15", "ImageOnlyCheckpointLoader", {{"ckpt_name": 'svd.safetensors'}})
+workflow.add_node("cliptextencode_9", "CLIPTextEncode", {"text": '(realistic, high-quality:1.2)'})
+workflow.add_node("cliptextencode_10", "CLIPTextEncode", {"text": '(low-quality, blurred:1.2)'})
+workflow.add_node("svd_img2vid_conditioning_3", "SVD_img2vid_Conditioning", {"width": 1024, "height": 576, "video_frames": 24, "motion_bucket_id": 100, "fps": 6, "augmentation_level": 0})
+workflow.add_node("ksampleradvanced_7", "KSamplerAdvanced", {"add_noise": 'enable', "noise_seed": 49770757027309, "control_after_generate": 'fixed', "steps": 20, "cfg": 2.52, "sampler_name": 'euler', "scheduler": 'ddim_uniform', "start_at_step": 0, "end_at_step": 10000, "return_with_leftover_noise": 'disable'})
+workflow.add_node("imageonlycheckpointloader_15", "ImageOnlyCheckpointLoader", {"ckpt_name": 'svd.safetensors'})
 
 # Invoke Node
 workflow.invoke_node(["positive_cond_9"], "cliptextencode_9")
@@ -128,8 +98,8 @@ Solution 2: Search for required nodes from the reference to provide clip of type
 
 Here are the relevant refined code that apply solution 1:
 # Add Node
-workflow.add_node("svd_img2vid_conditioning_3", "SVD_img2vid_Conditioning", {{"width": 1024, "height": 576, "video_frames": 24, "motion_bucket_id": 100, "fps": 6, "augmentation_level": 0}})
-workflow.add_node("ksampleradvanced_7", "KSamplerAdvanced", {{"add_noise": 'enable', "noise_seed": 49770757027309, "control_after_generate": 'fixed', "steps": 20, "cfg": 2.52, "sampler_name": 'euler', "scheduler": 'ddim_uniform', "start_at_step": 0, "end_at_step": 10000, "return_with_leftover_noise": 'disable'}})
+workflow.add_node("svd_img2vid_conditioning_3", "SVD_img2vid_Conditioning", {"width": 1024, "height": 576, "video_frames": 24, "motion_bucket_id": 100, "fps": 6, "augmentation_level": 0})
+workflow.add_node("ksampleradvanced_7", "KSamplerAdvanced", {"add_noise": 'enable', "noise_seed": 49770757027309, "control_after_generate": 'fixed', "steps": 20, "cfg": 2.52, "sampler_name": 'euler', "scheduler": 'ddim_uniform', "start_at_step": 0, "end_at_step": 10000, "return_with_leftover_noise": 'disable'})
 
 # Invoke Node
 workflow.invoke_node(["positive_cond_3", "negative_cond_3", "latent_3"], "svd_img2vid_conditioning_3")
@@ -154,8 +124,8 @@ Node - `unCLIPConditioning`: This node is designed to integrate CLIP vision outp
         - `conditioning`: The enriched conditioning data, now containing integrated CLIP vision outputs with applied strength and noise augmentation. Type should be `CONDITIONING`.
 
 # Add Node
-workflow.add_node("unclipconditioning_19", "unCLIPConditioning", {{"strength": 0.5, "noise_augmentation": 0.4000000000000002}})
-workflow.add_node("unclipconditioning_37", "unCLIPConditioning", {{"strength": 0.5, "noise_augmentation": 0.4000000000000002}})
+workflow.add_node("unclipconditioning_19", "unCLIPConditioning", {"strength": 0.5, "noise_augmentation": 0.4000000000000002})
+workflow.add_node("unclipconditioning_37", "unCLIPConditioning", {"strength": 0.5, "noise_augmentation": 0.4000000000000002})
 
 # Invoke Node
 workflow.invoke_node(["clip_vision_output"], "unclipconditioning_19")
@@ -179,7 +149,7 @@ and unclipconditioning should be connected to previous clip vision's output and
 
 <example4>
 # Add Node
-workflow.add_node("imageonlycheckpointloader_15", "ImageOnlyCheckpointLoader", {{"ckpt_name": 'stable_zero123.ckpt'}})
+workflow.add_node("imageonlycheckpointloader_15", "ImageOnlyCheckpointLoader", {"ckpt_name": 'stable_zero123.ckpt'})
 
 # Invoke Node
 workflow.invoke_node(["clip_vision_15", "vae_15"], "imageonlycheckpointloader_15")
@@ -212,7 +182,7 @@ Node - `SaveAnimatedWEBP`: The SaveAnimatedWEBP node description.
     - Outputs:
     
 # Add Node
-workflow.add_node("saveanimatedwebp_11", "SaveAnimatedWEBP", {{"filename_prefix": 'ComfyUI', "fps": 10.0, "lossless": False, "quality": 85, "method": 'default'}})
+workflow.add_node("saveanimatedwebp_11", "SaveAnimatedWEBP", {"filename_prefix": 'ComfyUI', "fps": 10.0, "lossless": False, "quality": 85, "method": 'default'})
 
 # Invoke Node
 workflow.invoke_node(["image_4"], "saveanimatedwebp_11")
@@ -230,9 +200,9 @@ Solution: Remove the invoke of saveanimatedwebp_11 in Invoke part and connect im
 
 <example6>
 # Add Node
-workflow.add_node("svd_img2vid_conditioning_12", "SVD_img2vid_Conditioning", {{"width": 1024, "height": 576, "video_frames": 14, "motion_bucket_id": 127, "fps": 6, "augmentation_level": 0}})
-workflow.add_node("loadimage_23", "LoadImage", {{"image": 'mountains.png'}})
-workflow.add_node("imageonlycheckpointloader_15", "ImageOnlyCheckpointLoader", {{"ckpt_name": 'svd.safetensors'}})
+workflow.add_node("svd_img2vid_conditioning_12", "SVD_img2vid_Conditioning", {"width": 1024, "height": 576, "video_frames": 14, "motion_bucket_id": 127, "fps": 6, "augmentation_level": 0})
+workflow.add_node("loadimage_23", "LoadImage", {"image": 'mountains.png'})
+workflow.add_node("imageonlycheckpointloader_15", "ImageOnlyCheckpointLoader", {"ckpt_name": 'svd.safetensors'})
 
 # Invoke Node
 workflow.invoke_node(["model_15", "clip_vision_15", "vae_15"], "imageonlycheckpointloader_15")
@@ -288,6 +258,38 @@ Your code should be enclosed with "<code>" tag. For example: <code> workflow.add
 Finally, provide a brief description of the updated workflow and the expected effects as in the example.
 Your description should be enclosed with "<description>" tag. For example: <description> This workflow uses the text-to-image pipeline together with an upscaling module to generate a high-resolution image of a running horse. </description>.
 
+'''
+
+refiner_prompt = '''Now, you are provided with a partially constructed workflow. Your task is to refine the current workflow by fixing any errors and completing it to ensure it functions as expected. You should also check the type of the connection according to the node knowledge.
+
+The user query is as follows:
+
+{query}
+
+## Workspace
+
+The code and description of the current workflow you are working on is presented as follows:
+
+{workspace}
+
+## Nodes knowledge
+
+The corresponding knowledge for the nodes in current workflow is as follows:
+
+{node_knowledge}
+
+## Reference
+
+The code and description of the example workflow you are referring to are presented as follows:
+
+{reference}
+
+## Refinement
+
+However, an error occurred when running your code. This may be caused by missing nodes, incorrect parameter values, or incorrect connections between nodes. The detailed error message is presented as follows:
+
+{refinement}
+
 Now, provide your explanation, code, and description with the required format.
 '''
 
@@ -296,12 +298,13 @@ def get_refiner_inference_engine_prompt(query: str, linked_code: str, descript:
     query_content = query
 
     node_knowledge_content = get_node_knowledge(linked_code)
+    node_knowledge_content += get_related_node_knowledge(error_message, linked_code, NODE_DOCS_REFINER_COUNT)
       
     workspace_content = f'<code>\n{linked_code}\n</code>'
     workspace_content += f'<description>\n{descript}\n</description>'
     refinement_content = error_message.replace("HTTP Error 400: Bad Request", "Some nodes' input are missing! Check all the nodes' invocation and linking with the node knowledge carefully! Then add what's msiing in the correct place")
 
-    prompt_text = refiner_prompt.format(
+    prompt_text = refiner_prefix + refiner_prompt.format(
         node_knowledge = node_knowledge_content,
         workspace=workspace_content,
         refinement=refinement_content,
@@ -3,45 +3,13 @@ from bs4 import BeautifulSoup
 from inference_engine.pseudo_natural.utils.function import safe_extract_from_soup
 
 
-combiner_prompt = '''
+combiner_prefix = '''
 ## Task
 
 ComfyUI uses workflows to create and execute Stable Diffusion pipelines so that users can design their own workflows to generate highly customized artworks.
 ComfyUI provides many nodes. Each node represents a module in the pipeline. Users can formulate a workflow into Python code by instantiating nodes and invoking them for execution.
 You are an expert in ComfyUI who helps users to instantiate their own workflows nodes.
 
-Now you are required to create a ComfyUI workflow to finish the following task:
-
-The user query is as follows:
-
-{query}
-
-The key points behind the requirements and the expected paradigm of the workflow are analyzed as follows:
-
-{analysis}
-
-## Reference
-
-The code and description of the example workflow you are referring to are presented as follows:
-
-{reference}
-
-## Key Nodes
-*Note that brackets of nodes are represented by words of their names in codelines (e.g. LeftBracketComfy3DRightBracketSpaceTripoSR represent the node [Comfy3D] TripoSR), so you need to be careful to match them with the corresponding node knowledge.
-The user has provided the following key nodes that *must be included* in the workflow:
-
-{key_nodes}
-
-The corresponding knowledge for the key nodes is as follows:
-
-{key_node_knowledge}
-
-## Workspace
-
-The code of the current nodes instantiation you are working on are presented as follows:
-
-{code}
-
 ## Combination and Adaptation
 
 Following the current progress, the step-by-step plan is outlined as follows:
@@ -74,6 +42,40 @@ Your code should be enclosed with "<code>" tag. For example: <code> output_1 is
 After that, you should provide a brief description of the whole set of node instantiations and their intended roles in the workflow.
 Your description should be enclosed with "<description>" tag. For example: <description> Added an upscaling module to enhance image resolution. </description>.
 
+'''
+
+combiner_prompt = '''Now you are required to create a ComfyUI workflow to finish the following task:
+
+The user query is as follows:
+
+{query}
+
+The key points behind the requirements and the expected paradigm of the workflow are analyzed as follows:
+
+{analysis}
+
+## Reference
+
+The code and description of the example workflow you are referring to are presented as follows:
+
+{reference}
+
+## Key Nodes
+*Note that brackets of nodes are represented by words of their names in codelines (e.g. LeftBracketComfy3DRightBracketSpaceTripoSR represent the node [Comfy3D] TripoSR), so you need to be careful to match them with the corresponding node knowledge.
+The user has provided the following key nodes that *must be included* in the workflow:
+
+{key_nodes}
+
+The corresponding knowledge for the key nodes is as follows:
+
+{key_node_knowledge}
+
+## Workspace
+
+The code of the current nodes instantiation you are working on are presented as follows:
+
+{code}
+
 Now, provide your code and description with the required format.
 '''
 
@@ -87,7 +89,7 @@ def get_generator_inference_engine_prompt(
     key_node_knowledge:str
 ):
 
-    prompt_text = combiner_prompt.format(
+    prompt_text = combiner_prefix + combiner_prompt.format(
         code=f'<code>\n{code}\n</code>\n\n',
         query=query,
         analysis=analysis,
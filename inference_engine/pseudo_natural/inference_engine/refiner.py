@@ -2,46 +2,16 @@ from bs4 import BeautifulSoup
 
 from inference_engine.pseudo_natural.utils.function import safe_extract_from_soup
 from inference_engine.pseudo_natural.inference_engine.linker import get_node_knowledge
+from utils.node_docs import get_related_node_knowledge, NODE_DOCS_REFINER_COUNT
 
 
-refiner_prompt = '''
+refiner_prefix = '''
 ## Task
 
 ComfyUI uses workflows to create and execute Stable Diffusion pipelines so that users can design their own workflows to generate highly customized artworks.
 ComfyUI provides many nodes. Each node represents a module in the pipeline. Users can formulate a workflow into Python code by instantiating nodes and invoking them for execution.
 You are an expert in ComfyUI who helps users to design their own workflows.
 
-Now, you are provided with a partially constructed workflow. Your task is to refine the current workflow by fixing any errors and completing it to ensure it functions as expected.
-
-The user query is as follows:
-
-{query}
-
-## Workspace
-
-The code and description of the current workflow you are working on is presented as follows:
-
-{workspace}
-
-## Nodes knowledge
-
-*Note that brackets of nodes are represented by words of their names in codelines (e.g. LeftBracketComfy3DRightBracket_TripoSR represent the node [Comfy3D] TripoSR), so you need to be careful to match them with the corresponding node knowledge.
-The corresponding knowledge for the nodes in current workflow is as follows:
-
-{node_knowledge}
-
-## Reference
-
-The code and description of the example workflow you are referring to are presented as follows:
-
-{reference}
-
-## Refinement
-
-However, an error occurred when running your code. This may be caused by missing nodes, incorrect parameter values, or incorrect connections between nodes. The detailed error message is presented as follows:
-
-{refinement}
-
 ## Refinement Examples
 
 Here are some examples of how to fix some common errors of invalid code. Each example has the relevant infomation about the codes.
@@ -259,6 +229,39 @@ Your code should be enclosed with "<code>" tag. For example: <code> output_1 is
 Finally, provide a brief description of the updated workflow and the expected effects as in the example.
 Your description should be enclosed with "<description>" tag. For example: <description> This workflow uses the text-to-image pipeline together with an upscaling module to generate a high-resolution image of a running horse. </description>.
 
+'''
+
+refiner_prompt = '''Now, you are provided with a partially constructed workflow. Your task is to refine the current workflow by fixing any errors and completing it to ensure it functions as expected.
+
+The user query is as follows:
+
+{query}
+
+## Workspace
+
+The code and description of the current workflow you are working on is presented as follows:
+
+{workspace}
+
+## Nodes knowledge
+
+*Note that brackets of nodes are represented by words of their names in codelines (e.g. LeftBracketComfy3DRightBracket_TripoSR represent the node [Comfy3D] TripoSR), so you need to be careful to match them with the corresponding node knowledge.
+The corresponding knowledge for the nodes in current workflow is as follows:
+
+{node_knowledge}
+
+## Reference
+
+The code and description of the example workflow you are referring to are presented as follows:
+
+{reference}
+
+## Refinement
+
+However, an error occurred when running your code. This may be caused by missing nodes, incorrect parameter values, or incorrect connections between nodes. The detailed error message is presented as follows:
+
+{refinement}
+
 Now, provide your explanation, code, and description with the required format.
 '''
 
@@ -267,12 +270,13 @@ def get_refiner_inference_engine_prompt(query: str, linked_code: str, descript:
     query_content = query
 
     node_knowledge_content = get_node_knowledge(linked_code)
+    node_knowledge_content += get_related_node_knowledge(error_message, linked_code, NODE_DOCS_REFINER_COUNT)
       
     workspace_content = f'<code>\n{linked_code}\n</code>'
     workspace_content += f'<description>\n{descript}\n</description>'
     refinement_content = error_message
 
-    prompt_text = refiner_prompt.format(
+    prompt_text = refiner_prefix + refiner_prompt.format(
         node_knowledge = node_knowledge_content,
         workspace=workspace_content,
         refinement=refinement_content,
@@ -0,0 +1,19 @@
+import os
+import sys
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_main_rebuilds_default_workspace(monkeypatch):
+    # The modules read ./config.yaml and ./dataset relative to the repo root
+    monkeypatch.chdir(ROOT)
+    monkeypatch.syspath_prepend(ROOT)
+    monkeypatch.setattr(sys, 'argv', ['reference_bundle'])
+    reference_bundle = importlib.import_module('utils.reference_bundle')
+
+    reference_bundle.main()
+
+    bundle = reference_bundle.ReferenceBundle.load(reference_bundle.workspace)
+    assert bundle.references
+    assert os.path.exists(reference_bundle.bundle_path(reference_bundle.workspace))
@@ -0,0 +1,438 @@
+# OpenAI-compatible stand-in server for benchmarking the pipelines offline.
+#
+#   python -m tools.stand_in_server --port 8000 --latency 2.0 --fixtures tools/stand_in_fixtures.yaml
+#
+# then point openai.base_url (and embedding_base_url / claude.base_url) in
+# config.yaml at http://127.0.0.1:8000/v1. Chat completions are answered, in
+# order, from:
+#   1. the completion cache (recorded responses, keyed by prompt hash),
+#   2. the first fixture whose `match` occurs in the last message,
+#   3. the default answer of the fixtures file.
+# Embeddings are deterministic pseudo-random unit vectors derived from a hash
+# of the input, so retrieval runs end to end without a network. Files and
+# batches (/v1/files, /v1/batches) are kept in memory, and a batch answers
+# every line of its input file like a chat completion request.
+
+import os
+import re
+import json
+import time
+import yaml
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import threading
+import email.parser
+import email.policy
+import numpy as np
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from utils.cache import CompletionCache
+from utils.llm import STAGE_CLOSING_TAGS, _completion_key
+
+
+with open('./config.yaml', 'r') as file:
+    config = yaml.load(file, Loader=yaml.FullLoader)
+    cache_config = config.get('cache', {})
+
+DEFAULT_ANSWER = '<description>stand-in answer</description>'
+
+
+def load_fixtures(path):
+    if path is None:
+        return [], DEFAULT_ANSWER
+    with open(path, 'r') as fixtures_file:
+        fixtures = yaml.load(fixtures_file, Loader=yaml.FullLoader) or {}
+    rules = []
+    for rule in fixtures.get('rules', []):
+        response = rule.get('response')
+        if response is None:
+            with open(rule['response_file'], 'r') as response_file:
+                response = response_file.read()
+        rules.append((rule['match'], response))
+    return rules, fixtures.get('default', DEFAULT_ANSWER)
+
+
+def message_text(message):
+    content = message.get('content') or ''
+    if isinstance(content, list):
+        content = '\n'.join(part.get('text', '') for part in content if part.get('type') == 'text')
+    return content
+
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def apply_response_format(content, body):
+    # Scripted answers are written with tags; a JSON schema request gets the
+    # tagged sections as the properties of a JSON object instead
+    response_format = body.get('response_format') or {}
+    if response_format.get('type') != 'json_schema':
+        return content
+    properties = response_format['json_schema']['schema'].get('properties', {})
+    answer = {}
+    for name in properties:
+        match = re.search(rf'<{name}>(.*?)</{name}>', content, re.DOTALL)
+        answer[name] = match.group(1).strip() if match else ''
+    return json.dumps(answer, ensure_ascii=False)
+
+
+def apply_generation_params(content, body):
+    # Cut the answer the way the API does: at the first stop sequence (which
+    # is dropped) or after max_tokens
+    stop = body.get('stop') or []
+    for sequence in [stop] if isinstance(stop, str) else stop:
+        position = content.find(sequence)
+        if position != -1:
+            content = content[:position]
+    max_tokens = body.get('max_tokens') or body.get('max_completion_tokens')
+    if max_tokens and count_tokens(content) > max_tokens:
+        return content[:max_tokens * 4], 'length'
+    return content, 'stop'
+
+
+def embed(value, dimensions):
+    # Same input, same vector; inputs may arrive as strings or token ids
+    digest = hashlib.sha256(json.dumps(value).encode('utf-8')).digest()
+    generator = np.random.default_rng(int.from_bytes(digest[:8], 'little'))
+    vector = generator.standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class StandIn:
+    def __init__(self, cache, rules, default, latency=0.0, latency_jitter=0.0,
+                 tokens_per_second=0.0, embedding_dimensions=3072):
+        self.cache = cache
+        self.rules = rules
+        self.default = default
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.tokens_per_second = tokens_per_second
+        self.embedding_dimensions = embedding_dimensions
+        self.stats = {'replayed': 0, 'scripted': 0, 'default': 0, 'embeddings': 0, 'batches': 0}
+        self.files = {}
+        self.batches = {}
+        self._lock = threading.Lock()
+
+    def _count(self, source):
+        with self._lock:
+            self.stats[source] += 1
+
+    def wait(self):
+        delay = self.latency + random.uniform(-self.latency_jitter, self.latency_jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def answer(self, body):
+        # Returns (content, usage, finish_reason) for a chat completion request
+        model = body['model']
+        messages = body['messages']
+        params = {
+            name: value for name, value in body.items()
+            if name not in ('model', 'messages', 'stream', 'stream_options')
+        }
+        # Streamed requests were recorded under the closing tags they stopped
+        # after, which depend on the stage the request does not name
+        stop_after = [None]
+        if body.get('stream'):
+            stop_after += sorted(set(STAGE_CLOSING_TAGS.values()))
+        for tags in stop_after:
+            entry = self.cache.get(_completion_key(model, messages, params, tags))
+            if entry is not None:
+                self._count('replayed')
+                return entry['answer']['content'], entry['usage'], 'stop'
+
+        prompt = message_text(messages[-1]) if messages else ''
+        for match, response in self.rules:
+            if match in prompt:
+                self._count('scripted')
+                content = response
+                break
+        else:
+            self._count('default')
+            content = self.default
+        content = apply_response_format(content, body)
+        content, finish_reason = apply_generation_params(content, body)
+
+        prompt_tokens = sum(count_tokens(message_text(message)) for message in messages)
+        completion_tokens = count_tokens(content)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+        return content, usage, finish_reason
+
+    def embeddings(self, body):
+        inputs = body['input']
+        # A single string or a single list of token ids is one input
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = body.get('dimensions') or self.embedding_dimensions
+        base64_encoded = body.get('encoding_format') == 'base64'
+        data = []
+        for index, value in enumerate(inputs):
+            vector = embed(value, dimensions)
+            if base64_encoded:
+                embedding = base64.b64encode(vector.tobytes()).decode('ascii')
+            else:
+                embedding = vector.tolist()
+            data.append({'object': 'embedding', 'index': index, 'embedding': embedding})
+        self._count('embeddings')
+        tokens = sum(len(value) if isinstance(value, list) else count_tokens(value) for value in inputs)
+        return {
+            'object': 'list',
+            'data': data,
+            'model': body.get('model'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        }
+
+    def add_file(self, filename, purpose, data):
+        file_id = f'file-{uuid.uuid4().hex}'
+        with self._lock:
+            self.files[file_id] = {
+                'object': 'file',
+                'id': file_id,
+                'bytes': len(data),
+                'created_at': int(time.time()),
+                'filename': filename,
+                'purpose': purpose,
+                'status': 'processed'
+            }, data
+        return self.files[file_id][0]
+
+    def create_batch(self, body):
+        batch_id = f'batch_{uuid.uuid4().hex}'
+        batch = {
+            'object': 'batch',
+            'id': batch_id,
+            'endpoint': body['endpoint'],
+            'input_file_id': body['input_file_id'],
+            'completion_window': body.get('completion_window', '24h'),
+            'status': 'validating',
+            'created_at': int(time.time()),
+            'output_file_id': None,
+            'error_file_id': None,
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0}
+        }
+        with self._lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self._process_batch, args=(batch,), daemon=True).start()
+        return batch
+
+    def _process_batch(self, batch):
+        _, data = self.files[batch['input_file_id']]
+        requests = [json.loads(line) for line in data.decode('utf-8').splitlines() if line.strip()]
+        batch['request_counts']['total'] = len(requests)
+        batch['status'] = 'in_progress'
+        batch['in_progress_at'] = int(time.time())
+        self.wait()
+
+        outputs = []
+        for request in requests:
+            content, usage, finish_reason = self.answer(request['body'])
+            outputs.append(json.dumps({
+                'id': f'batch_req_{uuid.uuid4().hex}',
+                'custom_id': request['custom_id'],
+                'response': {
+                    'status_code': 200,
+                    'request_id': uuid.uuid4().hex,
+                    'body': completion_response(request['body']['model'], content, usage, finish_reason)
+                },
+                'error': None
+            }))
+            batch['request_counts']['completed'] += 1
+        output = self.add_file('batch_output.jsonl', 'batch_output', ('\n'.join(outputs) + '\n').encode('utf-8'))
+        self._count('batches')
+        batch['output_file_id'] = output['id']
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
+
+
+def parse_multipart(content_type, data):
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1') + data
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+def completion_response(model, content, usage, finish_reason='stop'):
+    return {
+        'id': f'chatcmpl-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'finish_reason': finish_reason,
+            'message': {'role': 'assistant', 'content': content}
+        }],
+        'usage': usage
+    }
+
+
+def completion_chunk(completion_id, model, delta, finish_reason=None, usage=None):
+    return {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [] if usage else [{
+            'index': 0,
+            'delta': delta,
+            'finish_reason': finish_reason
+        }],
+        'usage': usage
+    }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    stand_in = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        self._send_json({'error': {'message': message, 'type': 'invalid_request_error'}}, status)
+
+    def _send_bytes(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = self.path.rstrip('/').split('/')
+        if parts[-1] == 'stats':
+            self._send_json(self.stand_in.stats)
+        elif 'files' in parts[:-1] and parts[-1] == 'content' and parts[-2] in self.stand_in.files:
+            self._send_bytes(self.stand_in.files[parts[-2]][1])
+        elif 'files' in parts[:-1] and parts[-1] in self.stand_in.files:
+            self._send_json(self.stand_in.files[parts[-1]][0])
+        elif 'batches' in parts[:-1] and parts[-1] in self.stand_in.batches:
+            self._send_json(self.stand_in.batches[parts[-1]])
+        else:
+            self._send_error(404, f'Unknown endpoint: {self.path}')
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        if path.endswith('/files'):
+            length = int(self.headers.get('Content-Length', 0))
+            fields = parse_multipart(self.headers['Content-Type'], self.rfile.read(length))
+            filename, data = fields['file']
+            purpose = fields.get('purpose', (None, b'batch'))[1].decode('utf-8')
+            self._send_json(self.stand_in.add_file(filename, purpose, data))
+            return
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_error(400, 'Request body is not valid JSON')
+            return
+        if path.endswith('/batches'):
+            if body.get('input_file_id') not in self.stand_in.files:
+                self._send_error(404, f'No such file: {body.get("input_file_id")}')
+                return
+            self._send_json(self.stand_in.create_batch(body))
+        elif path.endswith('/chat/completions'):
+            self._chat_completions(body)
+        elif path.endswith('/embeddings'):
+            self.stand_in.wait()
+            self._send_json(self.stand_in.embeddings(body))
+        else:
+            self._send_error(404, f'Unknown endpoint: {self.path}')
+
+    def _chat_completions(self, body):
+        if 'model' not in body or 'messages' not in body:
+            self._send_error(400, 'model and messages are required')
+            return
+        content, usage, finish_reason = self.stand_in.answer(body)
+        self.stand_in.wait()
+        if not body.get('stream'):
+            self._send_json(completion_response(body['model'], content, usage, finish_reason))
+            return
+
+        # Server-sent events, paced at tokens_per_second when it is set
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        chunk_size = 16
+        events = [completion_chunk(completion_id, body['model'], {'role': 'assistant', 'content': ''})]
+        for start in range(0, len(content), chunk_size):
+            events.append(completion_chunk(completion_id, body['model'], {'content': content[start:start + chunk_size]}))
+        events.append(completion_chunk(completion_id, body['model'], {}, finish_reason=finish_reason))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            events.append(completion_chunk(completion_id, body['model'], {}, usage=usage))
+        try:
+            for event in events:
+                self.wfile.write(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+                self.wfile.flush()
+                if self.stand_in.tokens_per_second > 0:
+                    time.sleep(chunk_size / 4 / self.stand_in.tokens_per_second)
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early, e.g. once the answer tags were closed
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', type=str)
+    parser.add_argument('--port', default=8000, type=int)
+    parser.add_argument('--cache_path', default=cache_config.get('path', './cache/completions'), type=str)
+    parser.add_argument('--fixtures', default=None, type=str)
+    parser.add_argument('--latency', default=0.0, type=float)
+    parser.add_argument('--latency_jitter', default=0.0, type=float)
+    parser.add_argument('--tokens_per_second', default=0.0, type=float)
+    parser.add_argument('--embedding_dimensions', default=3072, type=int)
+    args = parser.parse_args()
+
+    rules, default = load_fixtures(args.fixtures)
+    StandInHandler.stand_in = StandIn(
+        cache=CompletionCache(args.cache_path, mode='replay'),
+        rules=rules,
+        default=default,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        tokens_per_second=args.tokens_per_second,
+        embedding_dimensions=args.embedding_dimensions
+    )
+    server = ThreadingHTTPServer((args.host, args.port), StandInHandler)
+    server.daemon_threads = True
+    print(f'Stand-in server on http://{args.host}:{args.port}/v1 ({len(rules)} fixtures, cache {os.path.abspath(args.cache_path)})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f'Served: {StandInHandler.stand_in.stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import yaml
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionMessage
+
+from utils.llm import completion_endpoint, completion_messages, generation_params, load_completion, store_completion
+from utils.runner import _advance
+from utils.retrieval import retrieve_references_batch
+
+with open('./config.yaml', 'r') as file:
+    config = yaml.load(file, Loader=yaml.FullLoader)
+    batch_config = config.get('batch', {})
+
+BATCH_PATH = batch_config.get('path')
+BATCH_POLL_INTERVAL = batch_config.get('poll_interval', 30)
+BATCH_COMPLETION_WINDOW = batch_config.get('completion_window', '24h')
+BATCH_ENDPOINT = '/v1/chat/completions'
+BATCH_FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchJob:
+    # One pipeline run whose steps are driven round by round: every round
+    # collects the pending completion of each job into one batch file
+
+    def __init__(self, index, pipeline, query, model):
+        self.index = index
+        self.pipeline = pipeline
+        self.query = query
+        self.model = model
+        self.context = contextvars.copy_context()
+        self.steps = None
+        self.request = None
+        self.result = None
+        self.error = None
+
+    @property
+    def waiting(self):
+        return self.request is not None
+
+    def start(self):
+        def begin():
+            self.pipeline._set_run_context()
+            self.steps = self.pipeline._steps(self.query)
+            return _advance(self.steps, None)
+        self._update(begin)
+
+    def send(self, value):
+        stage = self.request[0]
+        if stage != 'retrieval':
+            self.pipeline._log_prompt_cache(stage, value)
+        self._update(_advance, self.steps, value)
+
+    def fail(self, error):
+        self.pipeline._log_request_error(self.request[0], error)
+        self.steps.close()
+        self.request = None
+        self.error = error
+
+    def _update(self, function, *args):
+        try:
+            done, value = self.context.run(function, *args)
+        except Exception as error:
+            self.request = None
+            self.error = error
+            return
+        if done:
+            self.request = None
+            self.result = value
+        else:
+            self.request = value
+
+
+def write_batch_file(path, requests):
+    with open(path, 'w') as batch_file:
+        for custom_id, body in requests:
+            batch_file.write(json.dumps({
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': BATCH_ENDPOINT,
+                'body': body
+            }, ensure_ascii=False) + '\n')
+
+
+def read_batch_results(path):
+    # custom_id -> (answer, usage, finish_reason), or the exception of a
+    # failed request
+    results = {}
+    with open(path, 'r') as results_file:
+        for line in results_file:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get('response') or {}
+            if item.get('error') or response.get('status_code') != 200:
+                error = item.get('error') or response.get('body', {}).get('error')
+                results[item['custom_id']] = RuntimeError(f'Batch request failed: {error}')
+                continue
+            body = response['body']
+            choice = body['choices'][0]
+            answer = ChatCompletionMessage(role=choice['message']['role'], content=choice['message']['content'])
+            usage = CompletionUsage(**body['usage']) if body.get('usage') else None
+            results[item['custom_id']] = (answer, usage, choice.get('finish_reason'))
+    return results
+
+
+def submit_batch(client, input_path, state_path):
+    # A batch that was already submitted for the same input is picked up
+    # again instead of being submitted twice
+    batch = None
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as state_file:
+            batch = client.batches.retrieve(json.load(state_file)['id'])
+    if batch is None:
+        with open(input_path, 'rb') as input_file:
+            input_file_object = client.files.create(file=input_file, purpose='batch')
+        batch = client.batches.create(
+            input_file_id=input_file_object.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW
+        )
+        with open(state_path, 'w') as state_file:
+            json.dump({'id': batch.id, 'input_file_id': input_file_object.id}, state_file)
+
+    while batch.status not in BATCH_FINAL_STATUSES:
+        time.sleep(BATCH_POLL_INTERVAL)
+        batch = client.batches.retrieve(batch.id)
+    return batch
+
+
+def download_batch_results(client, batch, output_path):
+    # Successful and failed requests end up in separate files, merge them
+    lines = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            content = client.files.content(file_id).text
+            lines.extend(line for line in content.splitlines() if line.strip())
+    if not lines and batch.status != 'completed':
+        raise RuntimeError(f'Batch {batch.id} ended with status {batch.status}')
+    with open(output_path, 'w') as output_file:
+        output_file.write('\n'.join(lines) + '\n')
+
+
+def _resolve_local(jobs, executor):
+    # Retrieval and cached completions do not need to go through the batch
+    while True:
+        local = []
+        retrievals = {}
+        for job in jobs:
+            if not job.waiting:
+                continue
+            stage, payload = job.request
+            if stage == 'retrieval':
+                retrievals.setdefault((job.pipeline.num_refs, job.pipeline.code_style), []).append(job)
+            elif not job.pipeline.independent_sampling:
+                cached = job.context.run(load_completion, job.model, completion_messages(payload), stage)
+                if cached is not None:
+                    local.append((job, cached))
+        for (count, code_style), waiting in retrievals.items():
+            local.extend(_retrieve(waiting, count, code_style))
+        if not local:
+            return
+        list(executor.map(lambda item: item[0].send(item[1]), local))
+
+
+def _retrieve(jobs, count, code_style):
+    # The requirements of all jobs are embedded in bulk and searched at once
+    print(f'[Batch] retrieval: {len(jobs)} queries')
+    try:
+        references = retrieve_references_batch([job.request[1] for job in jobs], count=count, code_style=code_style)
+    except Exception as error:
+        for job in jobs:
+            job.fail(error)
+        return []
+    return list(zip(jobs, references))
+
+
+def run_batch(jobs, batch_path, use_claude=False, workers=1):
+    client, model = completion_endpoint(use_claude)
+    os.makedirs(batch_path, exist_ok=True)
+    jobs = [
+        BatchJob(index, pipeline, query, model)
+        for index, (pipeline, query) in enumerate(jobs)
+    ]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(BatchJob.start, jobs))
+        round_id = 0
+        while True:
+            _resolve_local(jobs, executor)
+            pending = [job for job in jobs if job.waiting]
+            if not pending:
+                break
+            round_id += 1
+
+            # Jobs asking for the same completion in one round share a request
+            requests = {}
+            shared_ids = {}
+            for job in pending:
+                stage, payload = job.request
+                messages = completion_messages(payload)
+                custom_id = f'job{job.index:05d}-{stage}'
+                if not job.pipeline.independent_sampling:
+                    custom_id = shared_ids.setdefault(json.dumps([stage, messages]), custom_id)
+                requests.setdefault(custom_id, []).append((job, stage, messages))
+            input_path = os.path.join(batch_path, f'round_{round_id:03d}.jsonl')
+            output_path = os.path.join(batch_path, f'round_{round_id:03d}_output.jsonl')
+            state_path = os.path.join(batch_path, f'round_{round_id:03d}_batch.json')
+            _write_round(input_path, output_path, state_path, [
+                (custom_id, {'model': model, 'messages': waiting[0][2], **generation_params(waiting[0][1])})
+                for custom_id, waiting in requests.items()
+            ])
+
+            print(f'[Batch] round {round_id}: {len(requests)} requests for {len(pending)} jobs')
+            started = time.time()
+            if not os.path.exists(output_path):
+                batch = submit_batch(client, input_path, state_path)
+                download_batch_results(client, batch, output_path)
+            latency = time.time() - started
+            results = read_batch_results(output_path)
+
+            def ingest(custom_id):
+                result = results.get(custom_id, RuntimeError(f'Batch result missing for {custom_id}'))
+                for position, (job, stage, messages) in enumerate(requests[custom_id]):
+                    if isinstance(result, Exception):
+                        job.fail(result)
+                        continue
+                    answer, usage, finish_reason = result
+                    answer = job.context.run(
+                        store_completion, model, messages, answer, usage, stage, latency,
+                        coalesced=position > 0, finish_reason=finish_reason
+                    )
+                    job.send((answer, usage))
+            list(executor.map(ingest, requests))
+
+    return [(job.pipeline, job.result, job.error) for job in jobs]
+
+
+def _write_round(input_path, output_path, state_path, requests):
+    # Results of an earlier attempt are reused only if they answer exactly
+    # this batch, so a resumed run never mixes in stale answers
+    temp_path = f'{input_path}.tmp'
+    write_batch_file(temp_path, requests)
+    if os.path.exists(input_path):
+        with open(input_path, 'rb') as old_file, open(temp_path, 'rb') as new_file:
+            unchanged = old_file.read() == new_file.read()
+        if unchanged:
+            os.remove(temp_path)
+            return
+    for stale_path in (output_path, state_path):
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+    os.replace(temp_path, input_path)
@@ -0,0 +1,101 @@
+import os
+import re
+import json
+import numpy as np
+
+from collections import Counter
+
+
+# Words that carry no signal for telling workflows apart
+STOPWORDS = frozenset('''
+a an and are as at be by for from has have in into is it its of on or that the
+this these those to was were which with you your can will using use used
+'''.split())
+
+# Words, with node types split at case changes: "ImageUpscaleWithModel"
+# and "VAEDecode" match "upscale" and "vae decode"
+_TOKEN_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+
+def tokenize(text):
+    # "image-to-video" and "image_to_video" match "image to video"
+    tokens = (token.lower() for token in _TOKEN_PATTERN.findall(text))
+    return [token for token in tokens if token not in STOPWORDS]
+
+
+class BM25Index:
+    # Okapi BM25 over a handful of documents, held as a dense term matrix
+    # of precomputed weights: a query only sums the columns of its terms
+
+    def __init__(self, names, vocabulary, weights):
+        self.names = list(names)
+        self.vocabulary = vocabulary
+        self.weights = weights
+        self.rows = {name: row for row, name in enumerate(self.names)}
+
+    @classmethod
+    def build(cls, names, texts, k1=1.5, b=0.75):
+        documents = [Counter(tokenize(text)) for text in texts]
+        vocabulary = {term: column for column, term in enumerate(sorted(set().union(*documents)))}
+
+        frequencies = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+        for row, counts in enumerate(documents):
+            for term, count in counts.items():
+                frequencies[row, vocabulary[term]] = count
+        lengths = frequencies.sum(axis=1, keepdims=True)
+        average_length = max(float(lengths.mean()), 1.0) if len(documents) else 1.0
+        document_frequency = (frequencies > 0).sum(axis=0)
+        idf = np.log(1 + (len(documents) - document_frequency + 0.5) / (document_frequency + 0.5))
+        weights = idf * frequencies * (k1 + 1) / (
+            frequencies + k1 * (1 - b + b * lengths / average_length)
+        )
+        return cls(names, vocabulary, weights.astype(np.float32))
+
+    def save(self, path):
+        # <path>/weights.npy holds the matrix, <path>/terms.json the names
+        # and vocabulary; the latter is written last
+        os.makedirs(path, exist_ok=True)
+        suffix = f'{os.getpid()}.tmp'
+        with open(os.path.join(path, f'weights.npy.{suffix}'), 'wb') as weights_file:
+            np.save(weights_file, self.weights)
+        with open(os.path.join(path, f'terms.json.{suffix}'), 'w') as terms_file:
+            json.dump({'names': self.names, 'vocabulary': self.vocabulary}, terms_file)
+        os.replace(os.path.join(path, f'weights.npy.{suffix}'), os.path.join(path, 'weights.npy'))
+        os.replace(os.path.join(path, f'terms.json.{suffix}'), os.path.join(path, 'terms.json'))
+
+    @classmethod
+    def load(cls, path):
+        # The weights are memory-mapped, not read
+        with open(os.path.join(path, 'terms.json'), 'r') as terms_file:
+            terms = json.load(terms_file)
+        weights = np.load(os.path.join(path, 'weights.npy'), mmap_mode='r')
+        if weights.shape != (len(terms['names']), len(terms['vocabulary'])):
+            raise ValueError(f'BM25 index {path} does not match its terms')
+        return cls(terms['names'], terms['vocabulary'], weights)
+
+    def scores(self, query):
+        columns = [self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary]
+        if not columns:
+            return np.zeros(len(self.names), dtype=np.float32)
+        return self.weights[:, columns].sum(axis=1)
+
+    def search(self, query, count):
+        # Names and scores of the `count` best matching documents, best
+        # first; documents sharing no term with the query are left out
+        scores = self.scores(query)
+        count = min(count, int((scores > 0).sum()))
+        if count <= 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.names[row], float(scores[row])) for row in top]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    # Fuses ranked name lists: every list adds 1 / (k + rank) to a name.
+    # Returns (name, fused score) pairs, best first.
+    scores = {}
+    for ranking in rankings:
+        for rank, name in enumerate(ranking, start=1):
+            scores[name] = scores.get(name, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import contextvars
+
+
+CACHE_MODES = ('off', 'readwrite', 'replay')
+
+# Hit/miss counters of the pipeline run executing in the current thread or task
+_run_stats = contextvars.ContextVar('completion_cache_stats', default=None)
+
+
+def completion_cache_key(model, messages, params=None):
+    payload = json.dumps({
+        'model': model,
+        'messages': messages,
+        'params': params or {}
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def track_cache_stats():
+    stats = {'hits': 0, 'misses': 0}
+    _run_stats.set(stats)
+    return stats
+
+
+class CompletionCache:
+    def __init__(self, path, mode='off', max_size_mb=1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f'Invalid completion cache mode: {mode}')
+        self.path = path
+        self.mode = mode
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    @property
+    def writable(self):
+        return self.mode == 'readwrite'
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], f'{key}.json')
+
+    def _count(self, hit):
+        stats = _run_stats.get()
+        if stats is not None:
+            stats['hits' if hit else 'misses'] += 1
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r') as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+        if self.writable:
+            # Touch the entry so that eviction follows least-recent use
+            try:
+                os.utime(entry_path)
+            except OSError:
+                pass
+        self._count(hit=True)
+        return entry
+
+    def put(self, key, entry):
+        if not self.writable:
+            return
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        data = json.dumps(entry, ensure_ascii=False)
+        temp_path = f'{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as entry_file:
+            entry_file.write(data)
+        os.replace(temp_path, entry_path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data.encode('utf-8'))
+            if self._size > self.max_size:
+                self._evict()
+
+    def _list_entries(self):
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        for root, _, files in os.walk(self.path):
+            for file_name in files:
+                if not file_name.endswith('.json'):
+                    continue
+                entry_path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._list_entries())
+
+    def _evict(self):
+        # Drop least recently used entries until 90% of the cap is free again
+        entries = sorted(self._list_entries())
+        size = sum(size for _, size, _ in entries)
+        target = int(self.max_size * 0.9)
+        for _, entry_size, entry_path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            size -= entry_size
+        self._size = size
+
+def make_cache_entry(model, content, role, usage):
+    return {
+        'model': model,
+        'answer': {
+            'role': role,
+            'content': content
+        },
+        'usage': usage,
+        'created': time.time()
+    }
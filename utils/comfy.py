@@ -17,12 +17,12 @@ SERVER_ADDRESS = comfyui_config['server_address']
 CLIENT_ID = str(uuid.uuid4())
 
 
-def queue_prompt(prompt):
+def queue_prompt(prompt, client_id=CLIENT_ID):
     request = Request(
         url=f'http://{SERVER_ADDRESS}/prompt',
         data=json.dumps({
             'prompt': prompt,
-            'client_id': CLIENT_ID
+            'client_id': client_id
         }).encode('utf-8')
     )
     with urlopen(request) as response:
@@ -47,9 +47,12 @@ def fetch_output(filename, subfolder):
 def execute_prompt(prompt):
     outputs = {}
 
+    # ComfyUI keeps one socket per client id, so concurrent executions
+    # must not share it
+    client_id = str(uuid.uuid4())
     socket = websocket.WebSocket()
-    socket.connect(f'ws://{SERVER_ADDRESS}/ws?clientId={CLIENT_ID}')
-    prompt_id = queue_prompt(prompt)['prompt_id']
+    socket.connect(f'ws://{SERVER_ADDRESS}/ws?clientId={client_id}')
+    prompt_id = queue_prompt(prompt, client_id)['prompt_id']
     while True:
         data = socket.recv()
         if isinstance(data, str):
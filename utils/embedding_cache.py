@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import contextlib
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # no advisory file locks, share within this process only
+    fcntl = None
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    # Persistent query embeddings of one embedding model:
+    #   <path>/vectors.f32  memory-mapped float32 matrix, one row per entry
+    #   <path>/index.json   text hash -> [row, last use], plus the matrix shape
+    # The matrix holds as many rows as fit in max_size_mb; when it is full,
+    # the least recently used row is overwritten. Reads and writes take a
+    # lock file, so worker processes of a sweep share one cache.
+
+    def __init__(self, path, max_size_mb=256):
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._index_mtime = None
+        self._vectors = None
+        self._touched = {}
+        self._thread_lock = threading.Lock()
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.path, 'vectors.f32')
+
+    @contextlib.contextmanager
+    def _locked(self):
+        os.makedirs(self.path, exist_ok=True)
+        with self._thread_lock, open(os.path.join(self.path, 'index.lock'), 'a+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        # Pick up entries written by other processes since the last look
+        try:
+            mtime = os.stat(self._index_path).st_mtime_ns
+        except OSError:
+            self._index, self._index_mtime, self._vectors = None, None, None
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            with open(self._index_path, 'r') as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            index = None
+        if self._index is None or index is None or self._shape(index) != self._shape(self._index):
+            self._vectors = None
+        self._index, self._index_mtime = index, mtime
+
+    @staticmethod
+    def _shape(index):
+        return index['capacity'], index['dimensions']
+
+    def _open_vectors(self, mode):
+        if self._vectors is None or self._vectors.mode != mode:
+            shape = self._shape(self._index)
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=shape)
+        return self._vectors
+
+    def _reset(self, dimensions):
+        capacity = max(1, self.max_size // (dimensions * 4))
+        np.memmap(self._vectors_path, dtype=np.float32, mode='w+', shape=(capacity, dimensions)).flush()
+        self._index = {'dimensions': dimensions, 'capacity': capacity, 'rows': {}}
+        self._vectors = None
+        self._touched = {}
+
+    def _write_index(self):
+        rows = self._index['rows']
+        for key, used in self._touched.items():
+            if key in rows:
+                rows[key][1] = max(rows[key][1], used)
+        self._touched = {}
+        temp_path = f'{self._index_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump(self._index, index_file)
+        os.replace(temp_path, self._index_path)
+        self._index_mtime = os.stat(self._index_path).st_mtime_ns
+
+    def get_many(self, texts):
+        # Vectors of the texts, None where missing, under a single lock
+        keys = [text_key(text) for text in texts]
+        with self._locked():
+            rows = self._index['rows'] if self._index else {}
+            vectors = self._open_vectors('r') if rows else None
+            found = []
+            for key in keys:
+                entry = rows.get(key)
+                found.append(None if entry is None else vectors[entry[0]].tolist())
+                if entry is not None:
+                    self._touched[key] = time.time()
+        hits = sum(vector is not None for vector in found)
+        self.hits += hits
+        self.misses += len(found) - hits
+        return found
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+    def put_many(self, texts, vectors):
+        # Stores the vectors and writes the index once for all of them
+        if not len(texts):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._locked():
+            if self._index is None or self._index['dimensions'] != vectors.shape[1]:
+                self._reset(vectors.shape[1])
+            rows = self._index['rows']
+            memmap = self._open_vectors('r+')
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                if key in rows:
+                    row = rows[key][0]
+                elif len(rows) < self._index['capacity']:
+                    row = len(rows)
+                else:
+                    evicted = min(rows, key=lambda name: max(rows[name][1], self._touched.get(name, 0)))
+                    row = rows.pop(evicted)[0]
+                    self._touched.pop(evicted, None)
+                memmap[row] = vector
+                rows[key] = [row, time.time()]
+            memmap.flush()
+            self._write_index()
+
+    def put(self, text, vector):
+        self.put_many([text], [vector])
+
+
+class CachedEmbeddings(Embeddings):
+    # Embeddings whose query vectors are served from an EmbeddingCache;
+    # documents are embedded as usual
+
+    def __init__(self, embedding, cache):
+        self.embedding = embedding
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        return self.embedding.embed_documents(texts)
+
+    def embed_query(self, text):
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = self.embedding.embed_query(text)
+            self.cache.put(text, vector)
+        return vector
+
+    def embed_queries(self, texts, batch_size=256):
+        # Query vectors of many texts: cached ones are read in one pass, the
+        # others are embedded `batch_size` at a time and stored together
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        embedded = dict(zip(missing, embed_in_chunks(self.embedding, missing, batch_size)))
+        self.cache.put_many(list(embedded), list(embedded.values()))
+        return [embedded[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+
+def embed_in_chunks(embedding, texts, batch_size=256):
+    # One embedding request (or forward pass) per chunk instead of per text.
+    # The embedding models in use embed queries and documents alike.
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embedding.embed_documents(texts[start:start + batch_size]))
+    return vectors
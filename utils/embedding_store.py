@@ -0,0 +1,108 @@
+import os
+import json
+import mmap
+import struct
+import numpy as np
+
+# Read-only embedding store, one file mapped by every process on a host:
+#   header      magic, format version, generation, row count, dimensions,
+#               and offset and length of each section below
+#   vectors     float32 matrix, row-major, 64-byte aligned
+#   ids         uint64 offsets (count + 1), then the utf-8 ids
+#   metadata    uint64 offsets (count + 1), then one JSON object per row
+#   info        JSON object about the whole store (e.g. embedding model)
+# A rebuild writes a new file and renames it over the old one: processes
+# that mapped the old file keep reading it until they reopen the store.
+STORE_MAGIC = b'EMBSTORE'
+STORE_VERSION = 1
+_HEADER = struct.Struct('<8sIIQQQQQQQQQ')
+_ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _strings_section(strings):
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return offsets.tobytes() + b''.join(encoded)
+
+
+def write_store(path, vectors, ids, metadata, info=None, generation=0):
+    vectors = np.ascontiguousarray(vectors, dtype='<f4')
+    if vectors.ndim != 2 or len(vectors) != len(ids) or len(ids) != len(metadata):
+        raise ValueError(f'Store {path}: {vectors.shape} vectors for {len(ids)} ids and {len(metadata)} metadata')
+    ids_section = _strings_section(ids)
+    metadata_section = _strings_section([json.dumps(item, ensure_ascii=False) for item in metadata])
+    info_section = json.dumps(info or {}, ensure_ascii=False).encode('utf-8')
+
+    vectors_offset = _align(_HEADER.size)
+    ids_offset = vectors_offset + vectors.nbytes
+    metadata_offset = ids_offset + len(ids_section)
+    info_offset = metadata_offset + len(metadata_section)
+    header = _HEADER.pack(
+        STORE_MAGIC, STORE_VERSION, vectors.shape[1], len(ids), generation,
+        vectors_offset, ids_offset, len(ids_section),
+        metadata_offset, len(metadata_section), info_offset, len(info_section)
+    )
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as store_file:
+        store_file.write(header)
+        store_file.write(b'\0' * (vectors_offset - _HEADER.size))
+        store_file.write(vectors.tobytes())
+        store_file.write(ids_section)
+        store_file.write(metadata_section)
+        store_file.write(info_section)
+        store_file.flush()
+        os.fsync(store_file.fileno())
+    os.replace(temp_path, path)
+
+
+class EmbeddingStore:
+    # A mapped store file. `vectors` is a read-only view of the mapping,
+    # so the page cache holds the only copy however many processes read it.
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as store_file:
+            self._identity = self._stat_identity(os.fstat(store_file.fileno()))
+            self._mmap = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, dimensions, count, self.generation,
+         vectors_offset, ids_offset, ids_length,
+         metadata_offset, metadata_length, info_offset, info_length) = _HEADER.unpack_from(self._mmap, 0)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError(f'Not an embedding store of version {STORE_VERSION}: {path}')
+        self.vectors = np.frombuffer(self._mmap, dtype='<f4', count=count * dimensions,
+                                     offset=vectors_offset).reshape(count, dimensions)
+        self.ids = self._read_strings(ids_offset, count)
+        self._metadata = (metadata_offset, count)
+        self.info = json.loads(self._mmap[info_offset:info_offset + info_length].decode('utf-8'))
+
+    @staticmethod
+    def _stat_identity(stat):
+        return stat.st_dev, stat.st_ino
+
+    def _read_strings(self, offset, count):
+        offsets = np.frombuffer(self._mmap, dtype='<u8', count=count + 1, offset=offset)
+        start = offset + offsets.nbytes
+        return [
+            self._mmap[start + int(begin):start + int(end)].decode('utf-8')
+            for begin, end in zip(offsets[:-1], offsets[1:])
+        ]
+
+    @property
+    def metadata(self):
+        # Decoded on first use, most readers only need vectors and ids
+        if isinstance(self._metadata, tuple):
+            self._metadata = [json.loads(item) for item in self._read_strings(*self._metadata)]
+        return self._metadata
+
+    def replaced(self):
+        # Whether a rebuild has swapped in a new file since this one was opened
+        try:
+            return self._stat_identity(os.stat(self.path)) != self._identity
+        except OSError:
+            return False
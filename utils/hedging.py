@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import contextvars
+
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+class LatencyTracker:
+    # Rolling window of live request latencies per endpoint key, used to
+    # decide how long to wait before a request is hedged
+
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append(seconds)
+
+    def percentile(self, key, percentile):
+        # None until enough samples were seen for a meaningful estimate
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+
+def _succeeded(future):
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+def _fallback(attempts):
+    # Nothing well-formed came back: prefer the primary's answer, then the
+    # hedge's, and raise the primary's error only if both failed
+    for attempt in attempts:
+        if _succeeded(attempt):
+            return attempt.result()
+    for attempt in attempts:
+        if attempt.done() and not attempt.cancelled():
+            raise attempt.exception()
+    raise RuntimeError('Hedged request produced no result')
+
+
+def hedge(primary, secondary, delay, accept, executor):
+    # Run `primary`; if it has not produced an accepted result after `delay`
+    # seconds, also run `secondary` and return the first accepted result.
+    # The slower request is left to finish in the background.
+    attempts = [executor.submit(contextvars.copy_context().run, primary)]
+    wait(attempts, timeout=delay)
+    if _succeeded(attempts[0]) and accept(attempts[0].result()):
+        return attempts[0].result()
+
+    attempts.append(executor.submit(contextvars.copy_context().run, secondary))
+    pending = set(attempts)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for attempt in attempts:
+            if attempt in done and _succeeded(attempt) and accept(attempt.result()):
+                return attempt.result()
+    return _fallback(attempts)
+
+
+async def ahedge(primary, secondary, delay, accept):
+    # Same as `hedge` on the event loop; the losing request is cancelled
+    attempts = [asyncio.ensure_future(primary())]
+    await asyncio.wait(attempts, timeout=delay)
+    if _succeeded(attempts[0]) and accept(attempts[0].result()):
+        return attempts[0].result()
+
+    attempts.append(asyncio.ensure_future(secondary()))
+    pending = set(attempts)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in attempts:
+                if attempt in done and _succeeded(attempt) and accept(attempt.result()):
+                    return attempt.result()
+    finally:
+        for attempt in pending:
+            attempt.cancel()
+    return _fallback(attempts)
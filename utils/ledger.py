@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import argparse
+import threading
+import contextvars
+
+
+# Engine, task and run of the pipeline executing in the current thread or task
+_run_context = contextvars.ContextVar('ledger_run_context', default=None)
+
+
+def set_run_context(engine=None, task_id=None, run_id=None, save_path=None):
+    context = {
+        'engine': engine,
+        'task_id': task_id,
+        'run_id': run_id,
+        'save_path': save_path
+    }
+    _run_context.set(context)
+    return context
+
+
+def get_cached_tokens(usage):
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if details is None:
+        return 0
+    if isinstance(details, dict):
+        return details.get('cached_tokens') or 0
+    return getattr(details, 'cached_tokens', 0) or 0
+
+
+class Ledger:
+    # One JSONL record per LLM call. Records are appended with a single
+    # write, so several worker processes can share one ledger file.
+
+    def __init__(self, enabled=True, path=None, pricing=None, batch_discount=0.5):
+        self.enabled = enabled
+        self.path = path
+        self.pricing = pricing or {}
+        self.batch_discount = batch_discount
+        self._lock = threading.Lock()
+
+    def estimate_cost(self, model, prompt_tokens, completion_tokens, cached_tokens):
+        price = self.pricing.get(model)
+        if price is None:
+            return None
+        cached_price = price.get('cached_input', price['input'])
+        cost = (prompt_tokens - cached_tokens) * price['input']
+        cost += cached_tokens * cached_price
+        cost += completion_tokens * price['output']
+        return cost / 1_000_000
+
+    def _resolve_path(self, context):
+        if self.path is not None:
+            return self.path
+        if context is not None and context['save_path'] is not None:
+            return os.path.join(context['save_path'], 'ledger.jsonl')
+        return None
+
+    def record(self, stage, model, usage, latency, cache_hit=False, batch=False, coalesced=False):
+        if not self.enabled:
+            return
+        context = _run_context.get()
+        path = self._resolve_path(context)
+        if path is None:
+            return
+
+        served_prompt_tokens = usage.prompt_tokens if usage else 0
+        served_completion_tokens = usage.completion_tokens if usage else 0
+        served_cached_tokens = get_cached_tokens(usage) if usage else 0
+        # A cache hit was paid for when it was stored, a coalesced call by
+        # the identical request it waited for: neither bills any tokens
+        if cache_hit or coalesced:
+            prompt_tokens = completion_tokens = cached_tokens = 0
+            cost = 0.0
+        else:
+            prompt_tokens = served_prompt_tokens
+            completion_tokens = served_completion_tokens
+            cached_tokens = served_cached_tokens
+            cost = self.estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+            if cost is not None and batch:
+                cost *= self.batch_discount
+        entry = {
+            'time': time.time(),
+            'engine': context['engine'] if context else None,
+            'task_id': context['task_id'] if context else None,
+            'run_id': context['run_id'] if context else None,
+            'stage': stage,
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_tokens': cached_tokens,
+            'served_prompt_tokens': served_prompt_tokens,
+            'served_completion_tokens': served_completion_tokens,
+            'served_cached_tokens': served_cached_tokens,
+            'latency': round(latency, 3),
+            'cost': cost,
+            'cache_hit': cache_hit,
+            'batch': batch,
+            'coalesced': coalesced
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        line = json.dumps(entry) + '\n'
+        with self._lock, open(path, 'a') as ledger_file:
+            ledger_file.write(line)
+
+
+def load_ledger(path):
+    entries = []
+    with open(path, 'r') as ledger_file:
+        for line in ledger_file:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def summarize_ledger(entries, keys):
+    import pandas as pd
+
+    frame = pd.DataFrame(entries)
+    if frame.empty:
+        return frame
+    frame['calls'] = 1
+    frame['cost'] = frame['cost'].fillna(0.0)
+    summary = frame.groupby(keys, dropna=False).agg({
+        'calls': 'sum',
+        'cache_hit': 'sum',
+        'prompt_tokens': 'sum',
+        'cached_tokens': 'sum',
+        'completion_tokens': 'sum',
+        'latency': 'sum',
+        'cost': 'sum'
+    })
+    summary = summary.rename(columns={'cache_hit': 'cache_hits', 'latency': 'latency_sum'})
+    summary['latency_mean'] = summary['latency_sum'] / summary['calls']
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ledger_path', nargs='+', type=str)
+    parser.add_argument('--by_stage', action='store_true', default=False)
+    args = parser.parse_args()
+
+    entries = []
+    for path in args.ledger_path:
+        entries.extend(load_ledger(path))
+    print(f'{len(entries)} LLM calls')
+
+    engine_keys = ['engine', 'stage'] if args.by_stage else ['engine']
+    print(' Per Engine '.center(80, '-'))
+    print(summarize_ledger(entries, engine_keys).to_string())
+    print()
+    print(' Per Task '.center(80, '-'))
+    print(summarize_ledger(entries, ['engine', 'task_id']).to_string())
+
+
+if __name__ == '__main__':
+    main()
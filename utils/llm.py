@@ -1,174 +1,707 @@
-import os
-import json
+import time
 import yaml
+import httpx
+import random
+import asyncio
+import email.utils
+import weakref
+import functools
+import threading
 
-from openai import OpenAI
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError
 # import anthropic
 from openai.types.chat import ChatCompletionMessage
+from openai.types import CompletionUsage
+
+from utils.cache import CompletionCache, completion_cache_key, make_cache_entry
+from utils.ratelimit import RateLimiter
+from utils.ledger import Ledger
+from utils.hedging import LatencyTracker, hedge, ahedge
+from utils.singleflight import SingleFlight, AsyncSingleFlight
+from utils.structured_output import response_format, parse_structured, render_tagged
+from concurrent.futures import ThreadPoolExecutor
 
 with open('./config.yaml', 'r') as file:
     config = yaml.load(file, Loader=yaml.FullLoader)
     openai_config = config['openai']
     claude_config = config['claude']
-    
+    llm_config = config.get('llm', {})
+    cache_config = config.get('cache', {})
+    rate_limit_config = config.get('rate_limit', {})
+    ledger_config = config.get('ledger', {})
+    hedging_config = config.get('hedging', {})
+    generation_config = config.get('generation', {})
 
 OPENAI_BASE_URL = openai_config['base_url']
 OPENAI_API_KEY = openai_config['api_key']
-OPENAI_EMBEDDING_MODEL = openai_config['embedding_model']
-OPENAI_EMBEDDING_BASE_URL = openai_config['embedding_base_url']
-OPENAI_EMBEDDING_API_KEY = openai_config['embedding_api_key']
 OPENAI_COMPLETION_MODEL = openai_config['completion_model']
 
 CLAUDE_API_KEY = claude_config['api_key']
 CLAUDE_BASE_URL = claude_config['base_url']
 CLAUDE_COMPLETION_MODEL = claude_config['completion_model']
 
-USE_COMFYBENCH_WORKFLOW = config['use_comfybench_workflow']
-
-workspace = "workflow_comfybench" if USE_COMFYBENCH_WORKFLOW else "workflow"
-
-def retrieve_references(requirement, model='OpenAI', count=3):
-    with open(f'./dataset/{workspace}/meta.json') as meta_file:
-        metadata = json.load(meta_file)
-
-    documents = []
-    for name, path in metadata.items():
-        with open(path['description'], 'r') as desc_file:
-            desc = desc_file.read()
-        meta = {
-            'name': name,
-            'description': path['description'],
-            workspace: path[workspace],
-            'code': path['code'],
-            'markdown': path['markdown']
-        }
-        documents.append(Document(desc, metadata=meta))
-
-    if model == 'OpenAI':
-        embedding = OpenAIEmbeddings(
-            model=OPENAI_EMBEDDING_MODEL,
-            base_url=OPENAI_EMBEDDING_BASE_URL,
-            api_key=OPENAI_EMBEDDING_API_KEY
-        )
-    elif model == 'BERT':
-        embedding = HuggingFaceEmbeddings(
-            model_name='google-bert/bert-base-uncased'
-        )
-    elif model == 'MPNet':
-        embedding = HuggingFaceEmbeddings(
-            model_name='facebook/m2m100_418M'
-        )
-    elif model == 'BAAI':
-        embedding = HuggingFaceEmbeddings(
-            model_name='BAAI/bge-large-en'
-        )
-    elif model == 'Qwen':
-        embedding = HuggingFaceEmbeddings(
-            model_name='Alibaba-NLP/gte-Qwen2-1.5B-instruct'
-        )
+LLM_MAX_CONNECTIONS = llm_config.get('max_connections', 32)
+LLM_MAX_KEEPALIVE_CONNECTIONS = llm_config.get('max_keepalive_connections', 16)
+LLM_CONNECT_TIMEOUT = llm_config.get('connect_timeout', 10)
+LLM_TIMEOUT = llm_config.get('timeout', 300)
+LLM_VISION_TIMEOUT = llm_config.get('vision_timeout', 600)
+LLM_MAX_RETRIES = llm_config.get('max_retries', 5)
+LLM_BACKOFF_BASE = llm_config.get('backoff_base', 1.0)
+LLM_BACKOFF_MAX = llm_config.get('backoff_max', 60)
+LLM_STREAM = llm_config.get('stream', False)
+LLM_COALESCE = llm_config.get('coalesce', True)
+LLM_STRUCTURED_OUTPUT = llm_config.get('structured_output', False)
 
-    database = f'./dataset/{workspace}/db/{model}'
-    if os.path.exists(database):
-        vectors = Chroma(
-            embedding_function=embedding,
-            persist_directory=database
-        )
+CACHE_MODE = cache_config.get('mode', 'off')
+CACHE_PATH = cache_config.get('path', './cache/completions')
+CACHE_MAX_SIZE_MB = cache_config.get('max_size_mb', 1024)
+
+RATE_LIMIT_PATH = rate_limit_config.get('path', './cache/rate_limit.json')
+RATE_LIMIT_REQUESTS_PER_MINUTE = rate_limit_config.get('requests_per_minute', 0)
+RATE_LIMIT_TOKENS_PER_MINUTE = rate_limit_config.get('tokens_per_minute', 0)
+
+LEDGER_ENABLED = ledger_config.get('enabled', True)
+LEDGER_PATH = ledger_config.get('path')
+LEDGER_PRICING = ledger_config.get('pricing', {})
+LEDGER_BATCH_DISCOUNT = ledger_config.get('batch_discount', 0.5)
+
+HEDGING_ENABLED = hedging_config.get('enabled', False)
+HEDGING_PERCENTILE = hedging_config.get('percentile', 95)
+HEDGING_INITIAL_DELAY = hedging_config.get('initial_delay', 30)
+HEDGING_MIN_DELAY = hedging_config.get('min_delay', 2)
+HEDGING_MIN_SAMPLES = hedging_config.get('min_samples', 20)
+HEDGING_WINDOW = hedging_config.get('window', 200)
+
+completion_cache = CompletionCache(
+    path=CACHE_PATH,
+    mode=CACHE_MODE,
+    max_size_mb=CACHE_MAX_SIZE_MB
+)
+
+rate_limiter = RateLimiter(
+    path=RATE_LIMIT_PATH,
+    requests_per_minute=RATE_LIMIT_REQUESTS_PER_MINUTE,
+    tokens_per_minute=RATE_LIMIT_TOKENS_PER_MINUTE
+)
+
+ledger = Ledger(
+    enabled=LEDGER_ENABLED,
+    path=LEDGER_PATH,
+    pricing=LEDGER_PRICING,
+    batch_discount=LEDGER_BATCH_DISCOUNT
+)
+
+latency_tracker = LatencyTracker(
+    window=HEDGING_WINDOW,
+    min_samples=HEDGING_MIN_SAMPLES
+)
+
+# Identical requests in flight at the same time share one call
+_inflight = SingleFlight()
+_ainflight = AsyncSingleFlight()
+
+# One pooled client per endpoint, shared by every thread of the process
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url, api_key):
+    key = (base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+            )
+            client = OpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                max_retries=0,
+                http_client=http_client
+            )
+            _clients[key] = client
+    return client
+
+
+# Async connection pools cannot be shared across event loops, so async
+# clients are pooled per loop and released together with it
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(base_url, api_key):
+    loop = asyncio.get_running_loop()
+    key = (base_url, api_key)
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+            )
+            client = AsyncOpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                max_retries=0,
+                http_client=http_client
+            )
+            clients[key] = client
+    return client
+
+
+def _load_cached_completion(key):
+    entry = completion_cache.get(key)
+    if entry is None:
+        return None
+    answer = ChatCompletionMessage(**entry['answer'])
+    usage = CompletionUsage(**entry['usage']) if entry['usage'] else None
+    return answer, usage
+
+
+def _store_cached_completion(key, model, answer, usage):
+    completion_cache.put(key, make_cache_entry(
+        model=model,
+        content=answer.content,
+        role=answer.role,
+        usage=usage.model_dump() if usage else None
+    ))
+
+
+def estimate_tokens(messages):
+    # Rough count (~4 characters per token) for rate limiting before the
+    # real usage is known
+    tokens = 0
+    for message in messages:
+        content = message['content']
+        if isinstance(content, str):
+            tokens += len(content) // 4 + 4
+            continue
+        for part in content:
+            if part.get('type') == 'text':
+                tokens += len(part['text']) // 4
+            else:
+                tokens += 255
+    return tokens
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            value = headers['retry-after']
+            try:
+                return float(value)
+            except ValueError:
+                retry_at = email.utils.parsedate_to_datetime(value)
+                return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def _is_retryable(error):
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def _retry_delay(model, error, attempt):
+    # Seconds to wait before the next attempt, or None to give up
+    if attempt >= LLM_MAX_RETRIES or not _is_retryable(error):
+        return None
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        rate_limiter.block(model, retry_after)
+        delay = retry_after
     else:
-        vectors = Chroma.from_documents(
-            documents=documents,
-            embedding=embedding,
-            persist_directory=database
-        )
+        # Exponential backoff with full jitter
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    print(f'[LLM] {error.__class__.__name__}: {error}; retrying in {delay:.1f}s ({attempt + 1}/{LLM_MAX_RETRIES})')
+    return delay
+
+
+# Tags that close the answer of each pipeline stage. Parsers ignore whatever
+# the model writes after them, so a streamed answer can be cut off there.
+STAGE_CLOSING_TAGS = {
+    'analyzer': ('</description>', '</keyword>'),
+    'generator': ('</code>', '</description>'),
+    'linker': ('</code>', '</description>'),
+    'refiner': ('</code>', '</description>'),
+    'one_step': ('</code>', '</description>')
+}
+
+
+def generation_params(stage):
+    # Request parameters of the stage's generation profile; unset values are
+    # left to the provider's defaults
+    profile = generation_config.get(stage) or {}
+    params = {name: value for name, value in profile.items() if value is not None}
+    structured_format = response_format(stage) if LLM_STRUCTURED_OUTPUT else None
+    if structured_format is not None:
+        # Stop sequences would only cut the JSON short
+        params.pop('stop', None)
+        params['response_format'] = structured_format
+    return params
+
+
+def _restore_stop(answer, finish_reason, params):
+    # The API drops the stop sequence it stopped at. Closing tags used as
+    # stop sequences are put back so that the tag parsers still find them.
+    stop = params.get('stop')
+    if finish_reason != 'stop' or not stop or not answer.content:
+        return answer
+    content = answer.content
+    for tag in [stop] if isinstance(stop, str) else stop:
+        if not tag.startswith('</') or not tag.endswith('>'):
+            continue
+        opening = '<' + tag[2:-1]
+        if content.count(opening) > content.count(tag):
+            return ChatCompletionMessage(role=answer.role, content=content + tag)
+    return answer
+
+
+def _finish_answer(stage, answer, finish_reason, params):
+    # Structured answers are laid out with the tags the engines parse;
+    # answers that do not follow the schema go to the tag parsers as they are
+    if 'response_format' in params:
+        fields = parse_structured(stage, answer.content)
+        if fields is None:
+            print(f'[Structured output] {stage} answer does not follow the schema, parsing tags instead')
+            return answer
+        return ChatCompletionMessage(role=answer.role, content=render_tagged(stage, fields))
+    return _restore_stop(answer, finish_reason, params)
+
+
+def _stage_closing_tags(stage):
+    if not LLM_STREAM:
+        return None
+    return STAGE_CLOSING_TAGS.get(stage)
+
+
+def _completion_key(model, messages, params, stop_after):
+    # Answers cut off at the closing tags must not be served to full requests
+    if stop_after:
+        params = {**params, 'stop_after': list(stop_after)}
+    return completion_cache_key(model, messages, params)
+
+
+class _StreamState:
+    def __init__(self, stop_after):
+        self.pending = list(stop_after or ())
+        self.window = max([len(tag) for tag in self.pending], default=0)
+        self.content = ''
+        self.usage = None
+        self.finish_reason = None
+        self.stopped = False
+
+    def feed(self, chunk):
+        # Returns the text delta of the chunk, if any
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return None
+        if chunk.choices[0].finish_reason is not None:
+            self.finish_reason = chunk.choices[0].finish_reason
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            return None
+        tail = self.content[-self.window:] if self.window else ''
+        self.content += delta
+        if self.pending:
+            recent = tail + delta
+            self.pending = [tag for tag in self.pending if tag not in recent]
+            self.stopped = not self.pending
+        return delta
+
+    def result(self, messages):
+        answer = ChatCompletionMessage(content=self.content, role='assistant')
+        usage = self.usage
+        if usage is None:
+            # The final usage chunk never arrives when we hang up early
+            prompt_tokens = estimate_tokens(messages)
+            completion_tokens = len(self.content) // 4
+            usage = CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        return answer, usage
+
+
+def _iter_stream(stream, state):
+    try:
+        for chunk in stream:
+            delta = state.feed(chunk)
+            if delta is not None:
+                yield delta
+            if state.stopped:
+                break
+    finally:
+        stream.close()
 
-    retriever = vectors.as_retriever(
-        search_kwargs={"k": count}
+
+async def _aiter_stream(stream, state):
+    try:
+        async for chunk in stream:
+            delta = state.feed(chunk)
+            if delta is not None:
+                yield delta
+            if state.stopped:
+                break
+    finally:
+        await stream.close()
+
+
+def _create_stream(client, model, messages, timeout, params):
+    return client.chat.completions.create(
+        model=model,
+        messages=messages,
+        timeout=timeout,
+        stream=True,
+        stream_options={'include_usage': True},
+        **params
+    )
+
+
+def _chat_completion(client, model, messages, timeout, params=None, stop_after=None, stage=None, independent=False):
+    started = time.time()
+    params = params or {}
+    key = _completion_key(model, messages, params, stop_after)
+    request = functools.partial(
+        _request_completion, client, model, messages, timeout, params, stop_after, key, stage, started
     )
+    # Independent samples neither reuse a cached answer nor a concurrent request
+    if independent:
+        return request()
+    cached = _load_cached_completion(key)
+    if cached is not None:
+        ledger.record(stage, model, cached[1], time.time() - started, cache_hit=True)
+        return cached
+    if not LLM_COALESCE:
+        return request()
+    (answer, usage), shared = _inflight.run(key, request)
+    if shared:
+        ledger.record(stage, model, usage, time.time() - started, coalesced=True)
+    return answer, usage
+
 
-    references = retriever.invoke(requirement)
-    return references
+def _request_completion(client, model, messages, timeout, params, stop_after, key, stage, started):
+    estimated_tokens = estimate_tokens(messages) + params.get('max_tokens', 0)
+    attempt = 0
+    while True:
+        rate_limiter.acquire(model, estimated_tokens)
+        try:
+            if stop_after:
+                state = _StreamState(stop_after)
+                stream = _create_stream(client, model, messages, timeout, params)
+                for _ in _iter_stream(stream, state):
+                    pass
+                answer, usage = state.result(messages)
+                finish_reason = state.finish_reason
+            else:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=timeout,
+                    **params
+                )
+                answer = response.choices[0].message
+                usage = response.usage
+                finish_reason = response.choices[0].finish_reason
+            break
+        except Exception as error:
+            delay = _retry_delay(model, error, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+    answer = _finish_answer(stage, answer, finish_reason, params)
+    if usage is not None:
+        rate_limiter.settle(model, estimated_tokens, usage.total_tokens)
+    _store_cached_completion(key, model, answer, usage)
+    latency_tracker.record(model, time.time() - started)
+    ledger.record(stage, model, usage, time.time() - started)
+    return answer, usage
 
 
-def invoke_completion(message):
-    client = OpenAI(
-        base_url=OPENAI_BASE_URL,
-        api_key=OPENAI_API_KEY
+async def _achat_completion(client, model, messages, timeout, params=None, stop_after=None, stage=None, independent=False):
+    started = time.time()
+    params = params or {}
+    key = _completion_key(model, messages, params, stop_after)
+    request = functools.partial(
+        _arequest_completion, client, model, messages, timeout, params, stop_after, key, stage, started
     )
+    if independent:
+        return await request()
+    cached = _load_cached_completion(key)
+    if cached is not None:
+        ledger.record(stage, model, cached[1], time.time() - started, cache_hit=True)
+        return cached
+    if not LLM_COALESCE:
+        return await request()
+    (answer, usage), shared = await _ainflight.run(key, request)
+    if shared:
+        ledger.record(stage, model, usage, time.time() - started, coalesced=True)
+    return answer, usage
 
-    try:
-        response = client.chat.completions.create(
-            model=OPENAI_COMPLETION_MODEL,
-            messages=[{
-                'role': 'user',
-                'content': message
-            }]
-        )
-        # answer = response.choices[0].message
-        answer = response.choices[0].message
-        print(answer) 
-        usage = response.usage
 
-    except Exception as error:
-        answer = ChatCompletionMessage(content=f'Error: {error}', role='assistant')
-        usage = None
+async def _arequest_completion(client, model, messages, timeout, params, stop_after, key, stage, started):
+    estimated_tokens = estimate_tokens(messages) + params.get('max_tokens', 0)
+    attempt = 0
+    while True:
+        await rate_limiter.aacquire(model, estimated_tokens)
+        try:
+            if stop_after:
+                state = _StreamState(stop_after)
+                stream = await _create_stream(client, model, messages, timeout, params)
+                async for _ in _aiter_stream(stream, state):
+                    pass
+                answer, usage = state.result(messages)
+                finish_reason = state.finish_reason
+            else:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=timeout,
+                    **params
+                )
+                answer = response.choices[0].message
+                usage = response.usage
+                finish_reason = response.choices[0].finish_reason
+            break
+        except Exception as error:
+            delay = _retry_delay(model, error, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
 
+    answer = _finish_answer(stage, answer, finish_reason, params)
+    if usage is not None:
+        await asyncio.to_thread(rate_limiter.settle, model, estimated_tokens, usage.total_tokens)
+    _store_cached_completion(key, model, answer, usage)
+    latency_tracker.record(model, time.time() - started)
+    ledger.record(stage, model, usage, time.time() - started)
+    return answer, usage
+
+
+# Batch mode (utils/batch.py) sends the same requests through the Batch API
+# and shares the completion cache and the ledger with the calls below
+
+def completion_endpoint(use_claude=False):
+    if use_claude:
+        return get_client(CLAUDE_BASE_URL, CLAUDE_API_KEY), CLAUDE_COMPLETION_MODEL
+    return get_client(OPENAI_BASE_URL, OPENAI_API_KEY), OPENAI_COMPLETION_MODEL
+
+
+def completion_messages(message):
+    return [{
+        'role': 'user',
+        'content': message
+    }]
+
+
+def load_completion(model, messages, stage=None):
+    cached = _load_cached_completion(_completion_key(model, messages, generation_params(stage), None))
+    if cached is not None:
+        ledger.record(stage, model, cached[1], 0.0, cache_hit=True)
+    return cached
+
+
+def store_completion(model, messages, answer, usage, stage=None, latency=0.0, coalesced=False, finish_reason=None):
+    # Returns the answer as it is handed to the pipeline
+    params = generation_params(stage)
+    answer = _finish_answer(stage, answer, finish_reason, params)
+    if not coalesced:
+        _store_cached_completion(_completion_key(model, messages, params, None), model, answer, usage)
+    ledger.record(stage, model, usage, latency, batch=True, coalesced=coalesced)
+    return answer
+
+
+# The invoke functions raise once the retries are exhausted, instead of
+# handing an error message back to the caller as if it were the answer
+
+def invoke_completion(message, stage=None, independent=False):
+    client = get_client(OPENAI_BASE_URL, OPENAI_API_KEY)
+    answer, usage = _chat_completion(
+        client=client,
+        model=OPENAI_COMPLETION_MODEL,
+        messages=[{
+            'role': 'user',
+            'content': message
+        }],
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        params=generation_params(stage),
+        stop_after=_stage_closing_tags(stage),
+        stage=stage,
+        independent=independent
+    )
+    print(answer)
     return answer, usage
 
-def invoke_completion_claude(message):
+def invoke_completion_claude(message, stage=None, independent=False):
     # client = anthropic.Anthropic(
     #     api_key=ANTHROPIC_API_KEY,
     # )
-    client = OpenAI(
-        base_url=CLAUDE_BASE_URL,
-        api_key=CLAUDE_API_KEY
+    # response = client.messages.create(
+    #     model=ANTHROPIC_COMPLETION_MODEL,
+    #     messages=[{
+    #         "role": "user", 
+    #         "content": message
+    #     }]
+    # )
+    # answer = response.content[0].text
+    client = get_client(CLAUDE_BASE_URL, CLAUDE_API_KEY)
+    answer, usage = _chat_completion(
+        client=client,
+        model=CLAUDE_COMPLETION_MODEL,
+        messages=[{
+            'role': 'user',
+            'content': message
+        }],
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        params=generation_params(stage),
+        stop_after=_stage_closing_tags(stage),
+        stage=stage,
+        independent=independent
     )
-    try:
-        # response = client.messages.create(
-        #     model=ANTHROPIC_COMPLETION_MODEL,
-        #     messages=[{
-        #         "role": "user", 
-        #         "content": message
-        #     }]
-        # )
-        response = client.chat.completions.create(
-            model=CLAUDE_COMPLETION_MODEL,
-            messages=[{
-                'role': 'user',
-                'content': message
-            }]
-        )
-    
-        # answer = response.content[0].text
-        answer = response.choices[0].message
-        usage = response.usage
+    return answer, usage
+
+def invoke_vision(message: any) -> tuple[str, any]:
+    client = get_client(OPENAI_BASE_URL, OPENAI_API_KEY)
+    answer, usage = _chat_completion(
+        client=client,
+        model=OPENAI_COMPLETION_MODEL,
+        messages=message,
+        # params={'temperature': 0.5}
+        timeout=httpx.Timeout(LLM_VISION_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        params=generation_params('vision'),
+        stage='vision'
+    )
+    return answer.content, usage
 
-    except Exception as error:
-        answer = ChatCompletionMessage(content=f'Error: {error}', role='assistant')
-        usage = None
 
+async def ainvoke_completion(message, stage=None, independent=False):
+    client = get_async_client(OPENAI_BASE_URL, OPENAI_API_KEY)
+    answer, usage = await _achat_completion(
+        client=client,
+        model=OPENAI_COMPLETION_MODEL,
+        messages=[{
+            'role': 'user',
+            'content': message
+        }],
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        params=generation_params(stage),
+        stop_after=_stage_closing_tags(stage),
+        stage=stage,
+        independent=independent
+    )
+    print(answer)
     return answer, usage
 
-def invoke_vision(message: any) -> tuple[str, any]:
-    client = OpenAI(
-        base_url=OPENAI_BASE_URL,
-        api_key=OPENAI_API_KEY
+
+async def ainvoke_completion_claude(message, stage=None, independent=False):
+    client = get_async_client(CLAUDE_BASE_URL, CLAUDE_API_KEY)
+    answer, usage = await _achat_completion(
+        client=client,
+        model=CLAUDE_COMPLETION_MODEL,
+        messages=[{
+            'role': 'user',
+            'content': message
+        }],
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        params=generation_params(stage),
+        stop_after=_stage_closing_tags(stage),
+        stage=stage,
+        independent=independent
     )
+    return answer, usage
 
-    try:
-        response = client.chat.completions.create(
-            model=OPENAI_COMPLETION_MODEL,
-            messages=message,
-            # temperature=0.5
+
+# Hedged routing: the request goes to the primary endpoint, and to the
+# secondary as well once it has taken longer than the primary's latency
+# percentile. The first answer that contains the stage's tags wins.
+
+_hedge_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONNECTIONS)
+
+
+def _well_formed(stage, result):
+    answer, _ = result
+    tags = STAGE_CLOSING_TAGS.get(stage, ())
+    return all(tag in (answer.content or '') for tag in tags)
+
+
+def _hedge_delay(model):
+    delay = latency_tracker.percentile(model, HEDGING_PERCENTILE)
+    if delay is None:
+        delay = HEDGING_INITIAL_DELAY
+    return max(delay, HEDGING_MIN_DELAY)
+
+
+def invoke_completion_hedged(message, stage=None, use_claude=False, independent=False):
+    primary, secondary = invoke_completion, invoke_completion_claude
+    model = OPENAI_COMPLETION_MODEL
+    if use_claude:
+        primary, secondary = secondary, primary
+        model = CLAUDE_COMPLETION_MODEL
+    return hedge(
+        primary=functools.partial(primary, message, stage=stage, independent=independent),
+        secondary=functools.partial(secondary, message, stage=stage, independent=independent),
+        delay=_hedge_delay(model),
+        accept=functools.partial(_well_formed, stage),
+        executor=_hedge_executor
+    )
+
+
+async def ainvoke_completion_hedged(message, stage=None, use_claude=False, independent=False):
+    primary, secondary = ainvoke_completion, ainvoke_completion_claude
+    model = OPENAI_COMPLETION_MODEL
+    if use_claude:
+        primary, secondary = secondary, primary
+        model = CLAUDE_COMPLETION_MODEL
+    return await ahedge(
+        primary=functools.partial(primary, message, stage=stage, independent=independent),
+        secondary=functools.partial(secondary, message, stage=stage, independent=independent),
+        delay=_hedge_delay(model),
+        accept=functools.partial(_well_formed, stage)
+    )
+
+
+def get_completion_functions(use_claude=False):
+    # (invoke, ainvoke) used by the pipelines for their LLM stages
+    if HEDGING_ENABLED:
+        return (
+            functools.partial(invoke_completion_hedged, use_claude=use_claude),
+            functools.partial(ainvoke_completion_hedged, use_claude=use_claude)
         )
-        answer = response.choices[0].message.content
-        usage = response.usage
+    if use_claude:
+        return invoke_completion_claude, ainvoke_completion_claude
+    return invoke_completion, ainvoke_completion
 
-    except Exception as error:
-        answer = f'Error: {error}'
-        usage = None
 
-    return answer, usage
\ No newline at end of file
+async def ainvoke_vision(message: any) -> tuple[str, any]:
+    client = get_async_client(OPENAI_BASE_URL, OPENAI_API_KEY)
+    answer, usage = await _achat_completion(
+        client=client,
+        model=OPENAI_COMPLETION_MODEL,
+        messages=message,
+        timeout=httpx.Timeout(LLM_VISION_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        params=generation_params('vision'),
+        stage='vision'
+    )
+    return answer.content, usage
@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import yaml
+import argparse
+import threading
+
+from utils.bm25 import BM25Index
+
+with open('./config.yaml', 'r') as file:
+    config = yaml.load(file, Loader=yaml.FullLoader)
+    node_docs_config = config.get('node_docs', {})
+
+NODE_DOCS_PATH = node_docs_config.get('path', './dataset/docs/node')
+NODE_DOCS_INDEX_PATH = node_docs_config.get('index_path', './dataset/docs/index/node')
+# Node docs looked up for the capability the analyzer names, and for the
+# error the refiner is asked to fix; 0 turns either off
+NODE_DOCS_ANALYZER_COUNT = node_docs_config.get('analyzer_count', 3)
+NODE_DOCS_REFINER_COUNT = node_docs_config.get('refiner_count', 3)
+
+_NODE_TYPE_PATTERN = re.compile(r'^\s*-\s*`([^`]+)`')
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _squash(text):
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def _sources(docs_path):
+    sources = {}
+    for name in sorted(os.listdir(docs_path)):
+        if name.endswith('.md'):
+            stat = os.stat(os.path.join(docs_path, name))
+            sources[name] = [stat.st_mtime_ns, stat.st_size]
+    return sources
+
+
+class NodeDocIndex:
+    # BM25 over the node docs, built once and memory-mapped afterwards:
+    #   <path>/weights.npy, <path>/terms.json  the BM25Index
+    #   <path>/docs.json  node type and text per doc, with the mtime and
+    #                     size of the doc files it was built from
+
+    def __init__(self, bm25, docs):
+        self.bm25 = bm25
+        self.docs = docs
+
+    @classmethod
+    def load(cls, docs_path=NODE_DOCS_PATH, path=NODE_DOCS_INDEX_PATH, rebuild=False):
+        sources = _sources(docs_path)
+        if not rebuild:
+            try:
+                with open(os.path.join(path, 'docs.json'), 'r') as docs_file:
+                    docs = json.load(docs_file)
+                if docs['sources'] == sources:
+                    return cls(BM25Index.load(path), docs['docs'])
+            except (OSError, ValueError, KeyError):
+                pass
+
+        docs = {}
+        for name in sources:
+            with open(os.path.join(docs_path, name), 'r', encoding='utf-8') as doc_file:
+                text = doc_file.read()
+            match = _NODE_TYPE_PATTERN.match(text)
+            docs[name] = {'type': match.group(1) if match else name[:-len('.md')], 'text': text}
+        bm25 = BM25Index.build(list(docs), [doc['text'] for doc in docs.values()])
+        bm25.save(path)
+        # Written last, the index counts as built only once it is complete
+        temp_path = os.path.join(path, f'docs.json.{os.getpid()}.tmp')
+        with open(temp_path, 'w') as docs_file:
+            json.dump({'sources': sources, 'docs': docs}, docs_file)
+        os.replace(temp_path, os.path.join(path, 'docs.json'))
+        print(f'[NodeDocs] {len(docs)} node docs indexed in {path}')
+        return cls(BM25Index.load(path), docs)
+
+    def search(self, query, count=3, exclude=''):
+        # Docs of the `count` nodes best matching the query, best first,
+        # leaving out the nodes that already appear in `exclude` (code)
+        if count <= 0 or not query:
+            return []
+        excluded = _squash(exclude)
+        docs = []
+        for name, _ in self.bm25.search(query, len(self.docs)):
+            doc = self.docs[name]
+            if excluded and _squash(doc['type']) in excluded:
+                continue
+            docs.append(doc)
+            if len(docs) == count:
+                break
+        return docs
+
+
+def get_node_doc_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NodeDocIndex.load()
+        return _index
+
+
+def get_related_node_knowledge(query, code='', count=3):
+    # Node knowledge for what the query (an analysis or an error message)
+    # asks for, beyond the nodes the code already uses
+    docs = get_node_doc_index().search(query, count, exclude=code)
+    if not docs:
+        return ''
+    related = ''.join(f'Node {doc["text"]}\n' for doc in docs)
+    return f"<related node knowledge>\n{related}\n</related node knowledge>\n\n"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--query',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--count',
+        default=3,
+        type=int
+    )
+    args = parser.parse_args()
+
+    index = NodeDocIndex.load(rebuild=args.query is None)
+    if args.query:
+        for doc in index.search(args.query, args.count):
+            print(doc['type'])
+
+
+if __name__ == '__main__':
+    main()
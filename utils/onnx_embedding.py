@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+
+# How each model turns token states into one vector, as its
+# sentence-transformers configuration does
+ONNX_POOLING = {
+    'google-bert/bert-base-uncased': 'mean',
+    'BAAI/bge-large-en': 'cls',
+    'Alibaba-NLP/gte-Qwen2-1.5B-instruct': 'last'
+}
+
+# Input names the exported graphs may take, the tokenizer provides all three
+MODEL_INPUTS = ('input_ids', 'attention_mask', 'token_type_ids')
+
+
+def export_onnx(model_name, path, max_length=512):
+    # Exports the HuggingFace model to <path>/model.onnx once, with int8
+    # weights (dynamic quantization), next to its tokenizer and a config.
+    # Exporting needs torch, transformers and onnx; serving needs none of them.
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    if model_name not in ONNX_POOLING:
+        raise ValueError(f'No ONNX export for embedding model: {model_name}')
+    os.makedirs(path, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    model = AutoModel.from_pretrained(model_name, trust_remote_code=True).eval()
+    sample = tokenizer(['an example'], return_tensors='pt')
+    inputs = [name for name in MODEL_INPUTS if name in sample]
+    axes = {name: {0: 'batch', 1: 'tokens'} for name in inputs}
+    axes['last_hidden_state'] = {0: 'batch', 1: 'tokens'}
+
+    class Encoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(inputs, args))).last_hidden_state
+
+    # The fp32 graph (and its weights, over 2GB for gte-Qwen2) is only an
+    # intermediate of the quantization
+    full_dir = os.path.join(path, 'fp32')
+    os.makedirs(full_dir, exist_ok=True)
+    full_path = os.path.join(full_dir, 'model.onnx')
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(), tuple(sample[name] for name in inputs), full_path,
+            input_names=inputs, output_names=['last_hidden_state'],
+            dynamic_axes=axes, opset_version=17
+        )
+    large = sum(parameter.numel() for parameter in model.parameters()) * 4 >= 2 ** 31
+    quantize_dynamic(full_path, os.path.join(path, 'model.onnx'),
+                     weight_type=QuantType.QInt8, use_external_data_format=large)
+    shutil.rmtree(full_dir)
+
+    tokenizer.backend_tokenizer.save(os.path.join(path, 'tokenizer.json'))
+    with open(os.path.join(path, 'config.json'), 'w') as config_file:
+        json.dump({
+            'model': model_name,
+            'pooling': ONNX_POOLING[model_name],
+            'max_length': min(max_length, tokenizer.model_max_length),
+            'pad_id': tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+        }, config_file, indent=4)
+
+
+class OnnxEmbeddings(Embeddings):
+    # Serves an exported model with onnxruntime on the CPU. Texts are
+    # embedded in batches of similar length, so little goes into padding.
+    # onnxruntime and tokenizers are optional, needed by this backend only.
+    #   <path>/model.onnx      int8 quantized graph (see export_onnx)
+    #   <path>/tokenizer.json  fast tokenizer of the model
+    #   <path>/config.json     pooling, max_length and pad_id
+
+    def __init__(self, path, threads=4, batch_size=32):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        started = time.time()
+        with open(os.path.join(path, 'config.json'), 'r') as config_file:
+            self.config = json.load(config_file)
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(self.config['max_length'])
+        self.tokenizer.enable_padding(pad_id=self.config['pad_id'])
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(path, 'model.onnx'), options, providers=['CPUExecutionProvider']
+        )
+        self.inputs = [model_input.name for model_input in self.session.get_inputs()]
+        self.load_seconds = time.time() - started
+        # (calls, texts, seconds) of embed_query and of embed_documents
+        self.stats = {'query': [0, 0, 0.0], 'documents': [0, 0, 0.0]}
+        self._stats_lock = threading.Lock()
+        print(f'[Embedding] {self.config["model"]}: ONNX int8 loaded in {self.load_seconds:.2f}s with {threads} threads')
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        }
+        states = self.session.run(None, {name: feeds[name] for name in self.inputs})[0]
+        mask = feeds['attention_mask']
+        pooling = self.config['pooling']
+        if pooling == 'cls':
+            vectors = states[:, 0]
+        elif pooling == 'last':
+            vectors = states[np.arange(len(states)), mask.sum(axis=1) - 1]
+        else:
+            vectors = (states * mask[..., None]).sum(axis=1) / np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+
+    def _embed(self, texts):
+        order = sorted(range(len(texts)), key=lambda position: len(texts[position]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            positions = order[start:start + self.batch_size]
+            for position, vector in zip(positions, self._embed_batch([texts[position] for position in positions])):
+                vectors[position] = vector.tolist()
+        return vectors
+
+    def _timed(self, kind, texts):
+        started = time.time()
+        vectors = self._embed(texts)
+        with self._stats_lock:
+            stats = self.stats[kind]
+            stats[0] += 1
+            stats[1] += len(texts)
+            stats[2] += time.time() - started
+        return vectors
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._timed('documents', texts)
+
+    def embed_query(self, text):
+        return self._timed('query', [text])[0]
+
+    def report(self):
+        parts = [f'loaded in {self.load_seconds:.2f}s']
+        with self._stats_lock:
+            calls, _, seconds = self.stats['query']
+            if calls:
+                parts.append(f'{calls} queries at {seconds / calls * 1000:.1f}ms')
+            calls, texts, seconds = self.stats['documents']
+            if calls:
+                parts.append(f'{texts} texts in {calls} batched calls at {seconds / texts * 1000:.1f}ms per text')
+        return f'[Embedding] {self.config["model"]}: ' + ', '.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--model',
+        required=True,
+        choices=sorted(ONNX_POOLING),
+        type=str
+    )
+    parser.add_argument(
+        '--path',
+        required=True,
+        type=str
+    )
+    parser.add_argument(
+        '--max_length',
+        default=512,
+        type=int
+    )
+    args = parser.parse_args()
+
+    started = time.time()
+    export_onnx(args.model, args.path, args.max_length)
+    print(f'[Embedding] {args.model}: exported to {args.path} in {time.time() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # no advisory file locks, limit within this process only
+    fcntl = None
+
+
+class RateLimiter:
+    # Token buckets for requests/min and tokens/min, one pair per endpoint key.
+    # The bucket state lives in a small JSON file guarded by a lock file, so
+    # every worker process of a batch run draws from the same budget.
+
+    def __init__(self, path, requests_per_minute=0, tokens_per_minute=0):
+        self.path = path
+        self.requests_per_minute = requests_per_minute or 0
+        self.tokens_per_minute = tokens_per_minute or 0
+        self._thread_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.requests_per_minute > 0 or self.tokens_per_minute > 0
+
+    @contextlib.contextmanager
+    def _locked_state(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._thread_lock, open(f'{self.path}.lock', 'a+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path, 'r') as state_file:
+                        state = json.load(state_file)
+                except (OSError, ValueError):
+                    state = {}
+                yield state
+                temp_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(temp_path, 'w') as state_file:
+                    json.dump(state, state_file)
+                os.replace(temp_path, self.path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refill(self, bucket, now):
+        elapsed = max(0.0, now - bucket['updated'])
+        if self.requests_per_minute > 0:
+            bucket['requests'] = min(
+                self.requests_per_minute,
+                bucket['requests'] + elapsed * self.requests_per_minute / 60
+            )
+        if self.tokens_per_minute > 0:
+            bucket['tokens'] = min(
+                self.tokens_per_minute,
+                bucket['tokens'] + elapsed * self.tokens_per_minute / 60
+            )
+        bucket['updated'] = now
+
+    def _bucket(self, state, key, now):
+        bucket = state.get(key)
+        if bucket is None:
+            bucket = {
+                'requests': self.requests_per_minute,
+                'tokens': self.tokens_per_minute,
+                'updated': now,
+                'blocked_until': 0.0
+            }
+            state[key] = bucket
+        self._refill(bucket, now)
+        return bucket
+
+    def reserve(self, key, tokens):
+        # Take one request and `tokens` tokens, or return the seconds to wait
+        if not self.enabled:
+            return 0.0
+        # A single request larger than the whole bucket could never be served
+        if self.tokens_per_minute > 0:
+            tokens = min(tokens, self.tokens_per_minute)
+        with self._locked_state() as state:
+            now = time.time()
+            bucket = self._bucket(state, key, now)
+            if bucket['blocked_until'] > now:
+                return bucket['blocked_until'] - now
+
+            waits = []
+            if self.requests_per_minute > 0 and bucket['requests'] < 1:
+                waits.append((1 - bucket['requests']) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute > 0 and bucket['tokens'] < tokens:
+                waits.append((tokens - bucket['tokens']) * 60 / self.tokens_per_minute)
+            if waits:
+                return max(waits)
+
+            if self.requests_per_minute > 0:
+                bucket['requests'] -= 1
+            if self.tokens_per_minute > 0:
+                bucket['tokens'] -= tokens
+            return 0.0
+
+    def acquire(self, key, tokens):
+        while True:
+            wait = self.reserve(key, tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, key, tokens):
+        # The reservation takes the file lock, which may block: it runs in a
+        # worker thread so that waiting on it does not stall the event loop
+        while True:
+            wait = await asyncio.to_thread(self.reserve, key, tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def settle(self, key, estimated_tokens, actual_tokens):
+        # Correct the token bucket once the real usage of a request is known
+        if self.tokens_per_minute <= 0 or actual_tokens == estimated_tokens:
+            return
+        with self._locked_state() as state:
+            bucket = self._bucket(state, key, time.time())
+            bucket['tokens'] = min(
+                self.tokens_per_minute,
+                bucket['tokens'] + estimated_tokens - actual_tokens
+            )
+
+    def block(self, key, seconds):
+        # Pause every worker after the endpoint asked us to back off (Retry-After)
+        if not self.enabled:
+            return
+        with self._locked_state() as state:
+            now = time.time()
+            bucket = self._bucket(state, key, now)
+            bucket['blocked_until'] = max(bucket['blocked_until'], now + seconds)
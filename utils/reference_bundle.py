@@ -0,0 +1,178 @@
+import os
+import json
+import yaml
+import argparse
+import threading
+
+from utils.parser import parse_code_to_wfcode, parse_code_to_nature_code
+
+with open('./config.yaml', 'r') as file:
+    config = yaml.load(file, Loader=yaml.FullLoader)
+
+USE_COMFYBENCH_WORKFLOW = config['use_comfybench_workflow']
+
+workspace = "workflow_comfybench" if USE_COMFYBENCH_WORKFLOW else "workflow"
+
+# How each engine writes workflow code in its prompts: the corpus holds
+# plain code, declarative and onestep use wfcode, pseudo_natural nature code
+CODE_STYLES = {
+    'code': None,
+    'wfcode': parse_code_to_wfcode,
+    'nature': parse_code_to_nature_code
+}
+
+BUNDLE_VERSION = 1
+
+_bundles = {}
+_bundles_lock = threading.Lock()
+
+
+def bundle_path(workspace):
+    return f'./dataset/{workspace}/bundle/references.json'
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return [path, stat.st_mtime_ns, stat.st_size]
+
+
+def _sources(workspace):
+    # Files the bundle is rendered from, with their modification times
+    meta_path = f'./dataset/{workspace}/meta.json'
+    with open(meta_path, 'r') as meta_file:
+        metadata = json.load(meta_file)
+    return {
+        'meta': _signature(meta_path),
+        'references': {
+            name: [_signature(path['code']), _signature(path['description'])]
+            for name, path in metadata.items()
+        }
+    }, metadata
+
+
+def render_block(name, code, description):
+    return (
+        f'- Example: {name}\n\n'
+        f'<code>\n{code}\n</code>\n\n'
+        f'<description>\n{description}\n</description>\n\n'
+    )
+
+
+class ReferenceBundle:
+    # The code of every corpus workflow in each code style and its
+    # description, rendered once into the blocks the prompts are made of.
+    # One JSON file per workspace:
+    #   sources     meta.json, code and description files with their mtimes
+    #   empty       each style's rendering of no code (unknown keyword)
+    #   references  name -> description, code and block per style, and the
+    #               error of each style the code could not be converted to
+
+    def __init__(self, data):
+        self.data = data
+        self.references = data['references']
+
+    def __contains__(self, name):
+        return name in self.references
+
+    @classmethod
+    def build(cls, workspace, sources=None, metadata=None):
+        if sources is None:
+            sources, metadata = _sources(workspace)
+        references = {}
+        for name, path in metadata.items():
+            with open(path['code'], 'r') as code_file:
+                code = code_file.read()
+            with open(path['description'], 'r') as desc_file:
+                description = desc_file.read()
+            reference = {'description': description, 'code': {}, 'blocks': {}, 'errors': {}}
+            for style, convert in CODE_STYLES.items():
+                try:
+                    styled = convert(code) if convert else code
+                except Exception as error:
+                    reference['errors'][style] = str(error)
+                    continue
+                reference['code'][style] = styled
+                reference['blocks'][style] = render_block(name, styled, description)
+            references[name] = reference
+        return cls({
+            'version': BUNDLE_VERSION,
+            'sources': sources,
+            'empty': {style: convert('') if convert else '' for style, convert in CODE_STYLES.items()},
+            'references': references
+        })
+
+    @classmethod
+    def load(cls, workspace, rebuild=False):
+        # Rendered again if any source file changed since the bundle was built
+        path = bundle_path(workspace)
+        sources, metadata = _sources(workspace)
+        if not rebuild:
+            try:
+                with open(path, 'r') as bundle_file:
+                    data = json.load(bundle_file)
+                if data.get('version') == BUNDLE_VERSION and data.get('sources') == sources:
+                    return cls(data)
+            except (OSError, ValueError):
+                pass
+        bundle = cls.build(workspace, sources, metadata)
+        bundle.save(path)
+        print(f'[Bundle] {len(bundle.references)} references in {path}')
+        return bundle
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as bundle_file:
+            json.dump(self.data, bundle_file, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def _styled(self, name, style, field):
+        reference = self.references[name]
+        if style in reference['errors']:
+            raise ValueError(f'Reference {name} has no {style}: {reference["errors"][style]}')
+        return reference[field][style]
+
+    def code(self, name, style='code'):
+        # Code of the workflow in the style, or of no workflow for an
+        # unknown name; raises ValueError if the code does not convert
+        if name not in self.references:
+            return self.data['empty'][style]
+        return self._styled(name, style, 'code')
+
+    def description(self, name):
+        if name not in self.references:
+            return ''
+        return self.references[name]['description']
+
+    def block(self, name, style='code'):
+        # "- Example" entry with <code> and <description> of the workflow
+        return self._styled(name, style, 'blocks')
+
+
+def get_bundle(workspace=workspace):
+    # Loaded (or built) once per process and workspace
+    with _bundles_lock:
+        if workspace not in _bundles:
+            _bundles[workspace] = ReferenceBundle.load(workspace)
+        return _bundles[workspace]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--workspace',
+        nargs='+',
+        default=[workspace],
+        type=str
+    )
+    args = parser.parse_args()
+
+    for name in args.workspace:
+        bundle = ReferenceBundle.load(name, rebuild=True)
+        for reference_name, reference in bundle.references.items():
+            for style, error in reference['errors'].items():
+                print(f'[Bundle] {reference_name}: no {style} ({error})')
+
+
+if __name__ == '__main__':
+    main()
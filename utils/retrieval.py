@@ -0,0 +1,587 @@
+import os
+import json
+import yaml
+import hashlib
+import argparse
+import threading
+import numpy as np
+
+from langchain_chroma import Chroma
+from langchain_openai import OpenAIEmbeddings
+from langchain_core.documents import Document
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from utils.bm25 import BM25Index, reciprocal_rank_fusion
+from utils.onnx_embedding import OnnxEmbeddings, ONNX_POOLING, export_onnx
+from utils.embedding_cache import EmbeddingCache, CachedEmbeddings, embed_in_chunks
+from utils.embedding_store import EmbeddingStore, write_store
+from utils.reference_bundle import get_bundle
+
+with open('./config.yaml', 'r') as file:
+    config = yaml.load(file, Loader=yaml.FullLoader)
+    openai_config = config['openai']
+    retrieval_config = config.get('retrieval', {})
+    embedding_cache_config = config.get('embedding_cache', {})
+    onnx_config = config.get('onnx_embedding', {})
+
+OPENAI_EMBEDDING_MODEL = openai_config['embedding_model']
+OPENAI_EMBEDDING_BASE_URL = openai_config['embedding_base_url']
+OPENAI_EMBEDDING_API_KEY = openai_config['embedding_api_key']
+# Tokenizing with tiktoken downloads its encoding on first use
+OPENAI_EMBEDDING_CHECK_CTX_LENGTH = openai_config.get('embedding_check_ctx_length', True)
+
+USE_COMFYBENCH_WORKFLOW = config['use_comfybench_workflow']
+
+workspace = "workflow_comfybench" if USE_COMFYBENCH_WORKFLOW else "workflow"
+
+RETRIEVAL_BACKEND = retrieval_config.get('backend', 'numpy')
+RETRIEVAL_BACKENDS = ('numpy', 'chroma')
+RETRIEVAL_MODEL = retrieval_config.get('model', 'OpenAI')
+# Embedding model whose ranking 'Hybrid' fuses with BM25, and the rank
+# offset of reciprocal-rank fusion (higher flattens the top ranks)
+HYBRID_EMBEDDING_MODEL = retrieval_config.get('hybrid_embedding_model', 'OpenAI')
+RRF_K = retrieval_config.get('rrf_k', 60)
+# Maximal marginal relevance over MMR_FETCH candidates per reference, and
+# an optional budget of estimated tokens for the references of one prompt
+RETRIEVAL_MMR_LAMBDA = retrieval_config.get('mmr_lambda', 1.0)
+MMR_FETCH = retrieval_config.get('mmr_fetch', 4)
+RETRIEVAL_TOKEN_BUDGET = retrieval_config.get('token_budget')
+
+EMBEDDING_CACHE_ENABLED = embedding_cache_config.get('enabled', True)
+EMBEDDING_CACHE_PATH = embedding_cache_config.get('path', './cache/embeddings')
+EMBEDDING_CACHE_MAX_SIZE_MB = embedding_cache_config.get('max_size_mb', 256)
+EMBEDDING_BATCH_SIZE = retrieval_config.get('batch_size', 256)
+
+# Local models run through HuggingFace in full precision, or from an int8
+# ONNX export (exported on first use) with a bounded number of CPU threads
+LOCAL_EMBEDDING_BACKEND = retrieval_config.get('local_backend', 'huggingface')
+ONNX_PATH = onnx_config.get('path', './cache/onnx')
+ONNX_THREADS = onnx_config.get('threads', 4)
+ONNX_BATCH_SIZE = onnx_config.get('batch_size', 32)
+ONNX_MAX_LENGTH = onnx_config.get('max_length', 512)
+
+# Local embedding models by name
+HUGGINGFACE_MODELS = {
+    'BERT': 'google-bert/bert-base-uncased',
+    'MPNet': 'facebook/m2m100_418M',
+    'BAAI': 'BAAI/bge-large-en',
+    'Qwen': 'Alibaba-NLP/gte-Qwen2-1.5B-instruct'
+}
+
+# Embedding models and vector stores live for the whole process: loading a
+# local model or opening the database once per task is avoidable latency
+_embeddings = {}
+_vector_stores = {}
+_indexes = {}
+_documents = {}
+_bm25_indexes = {}
+_handles_lock = threading.Lock()
+
+
+def load_documents(workspace=workspace):
+    with open(f'./dataset/{workspace}/meta.json') as meta_file:
+        metadata = json.load(meta_file)
+
+    documents = []
+    for name, path in metadata.items():
+        with open(path['description'], 'r') as desc_file:
+            desc = desc_file.read()
+        meta = {
+            'name': name,
+            'description': path['description'],
+            workspace: path[workspace],
+            'code': path['code'],
+            'markdown': path['markdown']
+        }
+        documents.append(Document(desc, metadata=meta))
+    return documents
+
+
+def get_documents(workspace=workspace):
+    # name -> Document, read once per workspace
+    with _handles_lock:
+        if workspace not in _documents:
+            _documents[workspace] = {
+                document.metadata['name']: document
+                for document in load_documents(workspace)
+            }
+        return _documents[workspace]
+
+
+def _create_embedding(model):
+    if model == 'OpenAI':
+        return OpenAIEmbeddings(
+            model=OPENAI_EMBEDDING_MODEL,
+            base_url=OPENAI_EMBEDDING_BASE_URL,
+            api_key=OPENAI_EMBEDDING_API_KEY,
+            check_embedding_ctx_length=OPENAI_EMBEDDING_CHECK_CTX_LENGTH
+        )
+    if _uses_onnx(model):
+        path = os.path.join(ONNX_PATH, _embedding_name(model))
+        if not os.path.exists(os.path.join(path, 'model.onnx')):
+            print(f'[Embedding] exporting {HUGGINGFACE_MODELS[model]} to {path}')
+            export_onnx(HUGGINGFACE_MODELS[model], path, ONNX_MAX_LENGTH)
+        return OnnxEmbeddings(path, threads=ONNX_THREADS, batch_size=ONNX_BATCH_SIZE)
+    if model in HUGGINGFACE_MODELS:
+        return HuggingFaceEmbeddings(
+            model_name=HUGGINGFACE_MODELS[model]
+        )
+    raise ValueError(f'Unknown embedding model: {model}')
+
+
+def _uses_onnx(model):
+    return LOCAL_EMBEDDING_BACKEND == 'onnx' and HUGGINGFACE_MODELS.get(model) in ONNX_POOLING
+
+
+def _embedding_name(model):
+    # Cached vectors belong to the model behind the name, not to the name;
+    # int8 vectors differ from full precision ones
+    if model == 'OpenAI':
+        return f'{model}-{OPENAI_EMBEDDING_MODEL}'
+    name = f'{model}-{HUGGINGFACE_MODELS[model]}'.replace('/', '_')
+    return f'{name}-onnx-int8' if _uses_onnx(model) else name
+
+
+def get_embedding(model='OpenAI'):
+    with _handles_lock:
+        if model not in _embeddings:
+            embedding = _create_embedding(model)
+            if EMBEDDING_CACHE_ENABLED:
+                cache = EmbeddingCache(
+                    path=os.path.join(EMBEDDING_CACHE_PATH, _embedding_name(model)),
+                    max_size_mb=EMBEDDING_CACHE_MAX_SIZE_MB
+                )
+                embedding = CachedEmbeddings(embedding, cache)
+            _embeddings[model] = embedding
+        return _embeddings[model]
+
+
+def embedding_reports():
+    # Load time and latency of the local models served from ONNX
+    reports = []
+    with _handles_lock:
+        embeddings = list(_embeddings.values())
+    for embedding in embeddings:
+        embedding = getattr(embedding, 'embedding', embedding)
+        if isinstance(embedding, OnnxEmbeddings):
+            reports.append(embedding.report())
+    return reports
+
+
+def document_hash(document):
+    return hashlib.sha256(json.dumps({
+        'content': document.page_content,
+        'metadata': document.metadata
+    }, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def read_manifest(path):
+    # {'embedding': <model>, 'documents': {name: content hash}} of the index
+    # in `path`, None for an index built without one
+    try:
+        with open(os.path.join(path, 'manifest.json'), 'r') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, embedding_name, hashes):
+    temp_path = os.path.join(path, f'manifest.json.{os.getpid()}.tmp')
+    with open(temp_path, 'w') as manifest_file:
+        json.dump({'embedding': embedding_name, 'documents': hashes}, manifest_file, indent=4)
+    os.replace(temp_path, os.path.join(path, 'manifest.json'))
+
+
+def diff_manifest(manifest, hashes, embedding_name):
+    # (unchanged, stale, removed) document names. Without a manifest, or
+    # for another embedding model, every indexed document is stale.
+    indexed = {}
+    if manifest is not None and manifest.get('embedding') == embedding_name:
+        indexed = manifest.get('documents', {})
+    unchanged = [name for name, digest in hashes.items() if indexed.get(name) == digest]
+    stale = [name for name in hashes if indexed.get(name) != hashes[name]]
+    removed = [name for name in indexed if name not in hashes]
+    return unchanged, stale, removed
+
+
+def _log_update(label, path, unchanged, stale, removed):
+    if stale or removed:
+        print(f'[Index] {label}: {len(stale)} added or changed, {len(removed)} removed, {len(unchanged)} unchanged in {path}')
+
+
+def sync_vector_store(vectors, database, documents, embedding_name, full=False):
+    # Documents are stored under their names, so only added and changed
+    # ones are embedded again and removed ones are deleted
+    hashes = {document.metadata['name']: document_hash(document) for document in documents}
+    manifest = None if full else read_manifest(database)
+    unchanged, stale, removed = diff_manifest(manifest, hashes, embedding_name)
+    if not stale and not removed:
+        return
+    existing = vectors.get(include=[])['ids']
+    if manifest is None or manifest.get('embedding') != embedding_name:
+        # Built before the manifest (with random ids) or with another model
+        obsolete = existing
+    else:
+        obsolete = [name for name in existing if name in removed or name in stale]
+    if obsolete:
+        vectors.delete(ids=obsolete)
+    if stale:
+        stale_documents = [document for document in documents if document.metadata['name'] in stale]
+        vectors.add_documents(stale_documents, ids=[document.metadata['name'] for document in stale_documents])
+    write_manifest(database, embedding_name, hashes)
+    _log_update('chroma', database, unchanged, stale, removed)
+
+
+def get_vector_store(model='OpenAI', workspace=workspace):
+    # Opened once per process; the store is brought up to date with the
+    # documents on disk when it is opened
+    embedding = get_embedding(model)
+    with _handles_lock:
+        key = (workspace, model)
+        if key not in _vector_stores:
+            database = f'./dataset/{workspace}/db/{model}'
+            vectors = Chroma(
+                embedding_function=embedding,
+                persist_directory=database
+            )
+            sync_vector_store(vectors, database, load_documents(workspace), _embedding_name(model))
+            _vector_stores[key] = vectors
+        return _vector_stores[key]
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class NumpyIndex:
+    # Exact nearest neighbours over a normalized embedding matrix. The
+    # corpus is a few dozen workflows, so a dot product beats any database.
+    #   <path>/embeddings.store  one unit vector per document, with the
+    #                            document names as ids and their content
+    #                            hashes as metadata (see EmbeddingStore)
+    # The store is mapped read-only, processes on a host share one copy.
+
+    def __init__(self, path, embeddings, names, store=None):
+        self.path = path
+        self.embeddings = embeddings
+        self.names = names
+        self.store = store
+
+    @staticmethod
+    def index_path(model, workspace=workspace):
+        return f'./dataset/{workspace}/index/{model}'
+
+    @staticmethod
+    def store_path(path):
+        return os.path.join(path, 'embeddings.store')
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(cls.store_path(path))
+
+    @classmethod
+    def load(cls, path):
+        store = EmbeddingStore(cls.store_path(path))
+        return cls(path, store.vectors, store.ids, store)
+
+    @property
+    def manifest(self):
+        # Same shape as read_manifest, for diff_manifest
+        return {
+            'embedding': self.store.info.get('embedding'),
+            'documents': {name: item['hash'] for name, item in zip(self.names, self.store.metadata)}
+        }
+
+    @classmethod
+    def update(cls, path, documents, embedding, embedding_name, full=False):
+        # Embeds the documents that were added or changed since the store
+        # was written, keeps the vectors of the others and drops removed ones
+        hashes = {document.metadata['name']: document_hash(document) for document in documents}
+        index = None
+        if cls.exists(path):
+            try:
+                index = cls.load(path)
+            except ValueError:
+                index = None
+        manifest = index.manifest if index is not None and not full else None
+        unchanged, stale, removed = diff_manifest(manifest, hashes, embedding_name)
+        if manifest is not None and not stale and not removed:
+            return index
+
+        vectors = {}
+        if manifest is not None:
+            rows = {name: row for row, name in enumerate(index.names)}
+            vectors = {name: index.embeddings[rows[name]] for name in unchanged if name in rows}
+        missing = [document for document in documents if document.metadata['name'] not in vectors]
+        if missing:
+            embedded = _normalize(embedding.embed_documents([document.page_content for document in missing]))
+            vectors.update(zip([document.metadata['name'] for document in missing], embedded))
+        names = [document.metadata['name'] for document in documents]
+        embeddings = np.stack([vectors[name] for name in names]).astype(np.float32)
+
+        # The new store replaces the old one in a single rename; readers of
+        # the old one see `replaced()` and reopen
+        os.makedirs(path, exist_ok=True)
+        write_store(
+            cls.store_path(path), embeddings, names,
+            [{'hash': hashes[name]} for name in names],
+            info={'embedding': embedding_name},
+            generation=index.store.generation + 1 if index is not None else 0
+        )
+        for legacy in ('embeddings.npy', 'names.json', 'manifest.json'):
+            if os.path.exists(os.path.join(path, legacy)):
+                os.remove(os.path.join(path, legacy))
+        _log_update('numpy', path, unchanged, stale, removed)
+        return cls.load(path)
+
+    def search(self, query_vector, count):
+        # Names and scores of the `count` most similar documents, best first
+        return self.search_many([query_vector], count)[0]
+
+    def search_many(self, query_vectors, count):
+        # search for a batch of queries, scored in one matrix product
+        count = min(count, len(self.names))
+        if count <= 0:
+            return [[] for _ in query_vectors]
+        scores = _normalize(query_vectors) @ self.embeddings.T
+        top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+        return [
+            [(self.names[column], float(row_scores[column])) for column in row_top]
+            for row_scores, row_top in zip(scores, top)
+        ]
+
+
+def get_index(model='OpenAI', workspace=workspace):
+    # Loaded once per process, and again after a rebuild elsewhere. The
+    # index is built on first use if the build command was not run, and
+    # updated if the documents changed since.
+    path = NumpyIndex.index_path(model, workspace)
+    key = (workspace, model)
+    with _handles_lock:
+        index = _indexes.get(key)
+    # Another process rebuilding the index swaps in a new store
+    if index is not None and not index.store.replaced():
+        return index
+    index = NumpyIndex.update(path, load_documents(workspace), get_embedding(model), _embedding_name(model))
+    with _handles_lock:
+        _indexes[key] = index
+        return index
+
+
+def get_bm25_index(workspace=workspace):
+    # Lexical index over the description and the markdown of each workflow,
+    # built in memory on first use: no embedding model, no network
+    with _handles_lock:
+        index = _bm25_indexes.get(workspace)
+    if index is not None:
+        return index
+    documents = get_documents(workspace)
+    texts = []
+    for document in documents.values():
+        with open(document.metadata['markdown'], 'r') as md_file:
+            texts.append(f'{document.page_content}\n{md_file.read()}')
+    index = BM25Index.build(list(documents), texts)
+    with _handles_lock:
+        return _bm25_indexes.setdefault(workspace, index)
+
+
+def _embedding_models(model):
+    # Embedding models behind a retrieval model name
+    if model == 'BM25':
+        return ()
+    if model == 'Hybrid':
+        return (HYBRID_EMBEDDING_MODEL,)
+    return (model,)
+
+
+def warmup(models=None, workspace=workspace, backend=None):
+    # Load the embedding models and open (or build) their indexes up front,
+    # so that no pipeline pays for it in its first retrieval
+    backend = backend or RETRIEVAL_BACKEND
+    for model in models or (RETRIEVAL_MODEL,):
+        if model in ('BM25', 'Hybrid'):
+            get_bm25_index(workspace)
+        for embedding_model in _embedding_models(model):
+            get_embedding(embedding_model)
+            if backend == 'chroma':
+                get_vector_store(embedding_model, workspace)
+            else:
+                get_index(embedding_model, workspace)
+        get_documents(workspace)
+
+
+def embed_queries(model, texts):
+    # Query vectors of many texts in chunked bulk requests, see
+    # retrieval.batch_size; cached vectors are not embedded again
+    embedding = get_embedding(model)
+    if isinstance(embedding, CachedEmbeddings):
+        return embedding.embed_queries(texts, EMBEDDING_BATCH_SIZE)
+    return embed_in_chunks(embedding, texts, EMBEDDING_BATCH_SIZE)
+
+
+def maximal_marginal_relevance(matches, vectors, count, lambda_mult):
+    # Picks `count` of the (name, score) matches one at a time, each for its
+    # score less its similarity to those picked before, weighed by
+    # lambda_mult (1 keeps the plain ranking). `vectors` holds a vector
+    # per match; scores are scaled so the best one is 1.
+    if len(matches) <= 1:
+        return matches[:count]
+    scores = np.array([score for _, score in matches], dtype=np.float32)
+    relevance = scores / scores.max() if scores.max() > 0 else np.ones_like(scores)
+    similarity = _normalize(vectors) @ _normalize(vectors).T
+    redundancy = np.zeros(len(matches), dtype=np.float32)
+    available = np.ones(len(matches), dtype=bool)
+    selected = []
+    for _ in range(min(count, len(matches))):
+        marginal = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        choice = int(np.argmax(marginal))
+        selected.append(matches[choice])
+        available[choice] = False
+        redundancy = np.maximum(redundancy, similarity[choice])
+    return selected
+
+
+def _within_budget(references, token_budget, code_style='code'):
+    # Keeps references, best first, until the blocks the prompt gets for
+    # them (code in the engine's code style and description) would exceed
+    # the token budget (4 characters a token); the first always stays
+    if not token_budget:
+        return references
+    bundle = get_bundle()
+    kept, used = [], 0
+    for reference in references:
+        try:
+            tokens = len(bundle.block(reference.metadata['name'], code_style)) // 4
+        except ValueError:
+            # Code that does not convert to the style never reaches the prompt
+            tokens = 0
+        if kept and used + tokens > token_budget:
+            break
+        kept.append(reference)
+        used += tokens
+    return kept
+
+
+def _embedding_search(requirements, model, count, backend, mmr_lambda=1.0):
+    # Documents most similar to each requirement, best first, diversified
+    # by maximal marginal relevance when mmr_lambda is below 1
+    query_vectors = embed_queries(model, requirements)
+    diversify = mmr_lambda < 1
+    fetch = count * MMR_FETCH if diversify else count
+    if backend == 'chroma':
+        vectors = get_vector_store(model)
+        if diversify:
+            return [
+                vectors.max_marginal_relevance_search_by_vector(query_vector, k=count, fetch_k=fetch, lambda_mult=mmr_lambda)
+                for query_vector in query_vectors
+            ]
+        return [vectors.similarity_search_by_vector(query_vector, k=count) for query_vector in query_vectors]
+
+    index = get_index(model)
+    rows = {name: row for row, name in enumerate(index.names)}
+    documents = get_documents()
+    results = []
+    for matches in index.search_many(query_vectors, fetch):
+        matches = [(name, score) for name, score in matches if name in documents]
+        if diversify:
+            candidates = index.embeddings[[rows[name] for name, _ in matches]]
+            matches = maximal_marginal_relevance(matches, candidates, count, mmr_lambda)
+        results.append([documents[name] for name, _ in matches[:count]])
+    return results
+
+
+def retrieve_references_batch(requirements, model=None, count=3, backend=None, mmr_lambda=None, token_budget=None, code_style='code'):
+    # References of many requirements at once: the queries are embedded in
+    # bulk and scored against the index in one matrix product.
+    # `model` is an embedding model, 'BM25' for lexical matching only, or
+    # 'Hybrid' for BM25 and HYBRID_EMBEDDING_MODEL fused by their ranks.
+    # `mmr_lambda` and `token_budget` default to retrieval.mmr_lambda and
+    # retrieval.token_budget; the budget is measured on the reference blocks
+    # in `code_style`, the style of the engine's prompts.
+    model = model or RETRIEVAL_MODEL
+    backend = backend or RETRIEVAL_BACKEND
+    mmr_lambda = RETRIEVAL_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    token_budget = RETRIEVAL_TOKEN_BUDGET if token_budget is None else token_budget
+    if backend not in RETRIEVAL_BACKENDS:
+        raise ValueError(f'Unknown retrieval backend: {backend}')
+    requirements = list(requirements)
+    if not requirements:
+        return []
+    if model not in ('BM25', 'Hybrid'):
+        results = _embedding_search(requirements, model, count, backend, mmr_lambda)
+        return [_within_budget(references, token_budget, code_style) for references in results]
+
+    documents = get_documents()
+    bm25_index = get_bm25_index()
+    # Both rankings cover the whole corpus, fusion needs more than the top few
+    rankings = [[[name for name, _ in bm25_index.search(requirement, len(documents))]] for requirement in requirements]
+    if model == 'Hybrid':
+        matches = _embedding_search(requirements, HYBRID_EMBEDDING_MODEL, len(documents), backend)
+        for ranking, references in zip(rankings, matches):
+            ranking.append([document.metadata['name'] for document in references])
+    results = []
+    for ranking in rankings:
+        matches = [(name, score) for name, score in reciprocal_rank_fusion(ranking, k=RRF_K) if name in documents]
+        if mmr_lambda < 1:
+            # Lexical models tell documents apart by their BM25 term weights
+            matches = matches[:count * MMR_FETCH]
+            candidates = np.asarray(bm25_index.weights[[bm25_index.rows[name] for name, _ in matches]])
+            matches = maximal_marginal_relevance(matches, candidates, count, mmr_lambda)
+        results.append(_within_budget([documents[name] for name, _ in matches[:count]], token_budget, code_style))
+    return results
+
+
+def retrieve_references(requirement, model=None, count=3, backend=None, mmr_lambda=None, token_budget=None, code_style='code'):
+    return retrieve_references_batch([requirement], model, count, backend, mmr_lambda, token_budget, code_style)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--model',
+        nargs='+',
+        default=['OpenAI'],
+        type=str
+    )
+    parser.add_argument(
+        '--workspace',
+        default=workspace,
+        type=str
+    )
+    parser.add_argument(
+        '--backend',
+        default=RETRIEVAL_BACKEND,
+        choices=RETRIEVAL_BACKENDS,
+        type=str
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        default=False
+    )
+    args = parser.parse_args()
+
+    # Only added and changed documents are embedded unless --full is given
+    # BM25 is built in memory on use, 'Hybrid' needs its embedding index
+    documents = load_documents(args.workspace)
+    models = dict.fromkeys(name for model in args.model for name in _embedding_models(model))
+    for model in models:
+        if args.backend == 'chroma':
+            database = f'./dataset/{args.workspace}/db/{model}'
+            vectors = Chroma(
+                embedding_function=get_embedding(model),
+                persist_directory=database
+            )
+            sync_vector_store(vectors, database, documents, _embedding_name(model), full=args.full)
+            print(f'[Index] {model}: {len(documents)} documents in {database}')
+        else:
+            path = NumpyIndex.index_path(model, args.workspace)
+            index = NumpyIndex.update(path, documents, get_embedding(model), _embedding_name(model), full=args.full)
+            print(f'[Index] {model}: {len(index.names)} documents, {index.embeddings.shape[1]} dimensions in {path} (generation {index.store.generation})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+
+from utils.llm import completion_cache
+from utils.cache import track_cache_stats
+from utils.retrieval import retrieve_references
+from utils.ledger import set_run_context, get_cached_tokens
+
+
+def _advance(steps, value):
+    # StopIteration cannot cross a thread boundary, so unwrap it here
+    try:
+        return False, steps.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+class StepPipeline:
+    # A pipeline describes one run as a generator (`_steps`) that yields
+    # (stage, payload) requests and receives their results:
+    #   - ('retrieval', requirement) -> list of reference documents
+    #   - (<llm stage>, prompt)      -> (answer, usage) of the completion
+    # The same steps are driven synchronously by `__call__` and on an event
+    # loop by `acall`, where completions are awaited instead of blocking.
+
+    def _steps(self, query_text: str):
+        raise NotImplementedError
+
+    def _resolve(self, stage: str, payload):
+        if stage == 'retrieval':
+            return retrieve_references(
+                requirement=payload,
+                count=self.num_refs,
+                code_style=self.code_style
+            )
+        return self.invoke_completion(payload, stage=stage, independent=self.independent_sampling)
+
+    async def _aresolve(self, stage: str, payload):
+        if stage == 'retrieval':
+            return await asyncio.to_thread(self._resolve, stage, payload)
+        return await self.ainvoke_completion(payload, stage=stage, independent=self.independent_sampling)
+
+    def _log_request_error(self, stage: str, error: Exception):
+        self.logger.error(f'Request failed at stage {stage}: {error}')
+
+    def _log_prompt_cache(self, stage: str, result):
+        # Prompts start with a static prefix, so repeated calls of a stage
+        # should be served largely from the provider's prompt cache
+        if stage == 'retrieval' or result[1] is None:
+            return
+        usage = result[1]
+        self.logger.info(f'Cached prompt tokens ({stage}): {get_cached_tokens(usage)}/{usage.prompt_tokens}')
+
+    def _log_cache_stats(self, cache_stats: dict):
+        if completion_cache.enabled:
+            self.logger.info(f'Completion cache ({completion_cache.mode}): {cache_stats["hits"]} hits, {cache_stats["misses"]} misses')
+
+    engine_name = None
+    # Style of the reference code in the prompts (see utils.reference_bundle)
+    code_style = 'code'
+    task_id = None
+    run_id = None
+    # Identical prompts of concurrent runs share one completion unless every
+    # run should draw its own sample
+    independent_sampling = False
+
+    def _set_run_context(self):
+        set_run_context(
+            engine=self.engine_name,
+            task_id=self.task_id,
+            run_id=self.run_id,
+            save_path=self.save_path
+        )
+
+    def __call__(self, query_text: str):
+        self._set_run_context()
+        cache_stats = track_cache_stats()
+        try:
+            steps = self._steps(query_text)
+            done, value = _advance(steps, None)
+            while not done:
+                try:
+                    result = self._resolve(*value)
+                except Exception as error:
+                    self._log_request_error(value[0], error)
+                    raise
+                self._log_prompt_cache(value[0], result)
+                done, value = _advance(steps, result)
+            return value
+        finally:
+            self._log_cache_stats(cache_stats)
+
+    async def acall(self, query_text: str):
+        # Everything between two requests (parsing, file I/O, workflow
+        # execution) runs in a worker thread to keep the loop responsive
+        self._set_run_context()
+        cache_stats = track_cache_stats()
+        try:
+            steps = self._steps(query_text)
+            done, value = await asyncio.to_thread(_advance, steps, None)
+            while not done:
+                try:
+                    result = await self._aresolve(*value)
+                except Exception as error:
+                    self._log_request_error(value[0], error)
+                    raise
+                self._log_prompt_cache(value[0], result)
+                done, value = await asyncio.to_thread(_advance, steps, result)
+            return value
+        finally:
+            self._log_cache_stats(cache_stats)
@@ -0,0 +1,76 @@
+import asyncio
+import weakref
+import threading
+
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution: the first
+    # caller runs the function, the others wait for its result
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, function):
+        # Returns (result, shared), shared being True for the waiting callers
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = function()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight:
+    # SingleFlight for coroutines, with one table of calls per event loop
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def run(self, key, function):
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        while key in calls:
+            future = calls[key]
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # The caller running the request was cancelled (e.g. it lost
+                # a hedge), so someone else has to run it
+                if not future.cancelled():
+                    raise
+
+        future = loop.create_future()
+        calls[key] = future
+        try:
+            result = await function()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            # Mark it retrieved, nobody may be waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            if calls.get(key) is future:
+                del calls[key]
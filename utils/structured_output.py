@@ -0,0 +1,66 @@
+import re
+import html
+import json
+
+
+# Sections of each stage's answer, in the order the prompts ask for them
+STAGE_FIELDS = {
+    'analyzer': ('description', 'keyword'),
+    'generator': ('code', 'description'),
+    'linker': ('code', 'description'),
+    'refiner': ('explanation', 'code', 'description'),
+    'one_step': ('code', 'description')
+}
+
+_FENCE_PATTERN = re.compile(r'^```(?:json)?\s*(.*?)\s*```$', re.DOTALL)
+
+
+def response_format(stage):
+    # JSON schema request for the stage, None for stages without one
+    fields = STAGE_FIELDS.get(stage)
+    if fields is None:
+        return None
+    return {
+        'type': 'json_schema',
+        'json_schema': {
+            'name': f'{stage}_answer',
+            'strict': True,
+            'schema': {
+                'type': 'object',
+                'properties': {field: {'type': 'string'} for field in fields},
+                'required': list(fields),
+                'additionalProperties': False
+            }
+        }
+    }
+
+
+def parse_structured(stage, content):
+    # Fields of a valid structured answer, or None if the answer does not
+    # follow the schema (e.g. the endpoint ignored the response format)
+    fields = STAGE_FIELDS.get(stage)
+    if fields is None or not content:
+        return None
+    text = content.strip()
+    match = _FENCE_PATTERN.match(text)
+    if match:
+        text = match.group(1)
+    try:
+        answer = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(answer, dict):
+        return None
+    if not all(isinstance(answer.get(field), str) for field in fields):
+        return None
+    return {field: answer[field] for field in fields}
+
+
+def render_tagged(stage, answer):
+    # The tagged layout the prompts ask for, so that the engines' parsers
+    # read structured and free-form answers alike. Values are escaped, the
+    # parsers get them back verbatim even if the code contains '<' or '&'.
+    return '\n'.join(
+        f'<{field}>\n{html.escape(answer[field].strip(), quote=False)}\n</{field}>'
+        for field in STAGE_FIELDS[stage]
+    )
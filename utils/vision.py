@@ -0,0 +1,172 @@
+import io
+import os
+import math
+import yaml
+import base64
+import threading
+
+from collections import OrderedDict
+from PIL import Image
+
+with open('./config.yaml', 'r') as file:
+    config = yaml.load(file, Loader=yaml.FullLoader)
+    vision_config = config.get('vision', {})
+
+VISION_TOKEN_BUDGET = vision_config.get('token_budget', 1000)
+VISION_FORMAT = vision_config.get('format', 'jpeg')
+VISION_QUALITY = vision_config.get('quality', 85)
+VISION_MIN_FRAMES = vision_config.get('min_frames', 2)
+VISION_MODALITIES = vision_config.get('modalities', {})
+VISION_CACHE_SIZE = vision_config.get('cache_size', 256)
+
+# Image token accounting of the vision models: a low detail image costs a
+# flat 85 tokens; a high detail image is scaled to fit 2048x2048, then to
+# 768px on its short side, and costs 170 tokens per 512px tile on top
+LOW_DETAIL_TOKENS = 85
+TILE_TOKENS = 170
+TILE_SIZE = 512
+
+MIME_TYPES = {'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+
+def image_tokens(width, height, detail):
+    if detail == 'low':
+        return LOW_DETAIL_TOKENS
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return LOW_DETAIL_TOKENS + TILE_TOKENS * tiles
+
+
+def fit_size(width, height, detail, max_tiles=1):
+    # Size the image is sent at: the model never looks at more than 512px
+    # for low detail, and high detail is kept within `max_tiles` tiles. The
+    # aspect ratio is kept.
+    if detail == 'low':
+        limit_width = limit_height = TILE_SIZE
+    else:
+        columns = max(1, round(math.sqrt(max_tiles * width / height)))
+        rows = max(1, max_tiles // columns)
+        limit_width, limit_height = columns * TILE_SIZE, rows * TILE_SIZE
+    scale = min(1.0, limit_width / width, limit_height / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _thin(frames, count):
+    # Keep `count` frames spread evenly over the clip, first and last included
+    if count >= len(frames):
+        return frames
+    if count == 1:
+        return frames[:1]
+    return [frames[round(index * (len(frames) - 1) / (count - 1))] for index in range(count)]
+
+
+class VisionPart:
+    # One image of a vision message. `source` identifies a file on disk (and
+    # the frame in it), which lets the encoded image be reused across calls.
+
+    def __init__(self, image, detail='high', source=None):
+        self.image = image
+        self.detail = detail
+        self.source = source
+
+    def tokens(self, max_tiles):
+        width, height = fit_size(*self.image.size, self.detail, max_tiles)
+        return image_tokens(width, height, self.detail)
+
+
+class VisionPayload:
+    # Chooses detail, size and frame count of the images of one evaluation
+    # call so that they fit the token budget, and encodes them
+
+    def __init__(self, token_budget=VISION_TOKEN_BUDGET, image_format=VISION_FORMAT,
+                 quality=VISION_QUALITY, min_frames=VISION_MIN_FRAMES,
+                 modalities=VISION_MODALITIES, cache_size=VISION_CACHE_SIZE):
+        if image_format not in MIME_TYPES:
+            raise ValueError(f'Invalid vision image format: {image_format}')
+        self.token_budget = token_budget
+        self.image_format = image_format
+        self.quality = quality
+        self.min_frames = min_frames
+        self.modalities = modalities
+        self.cache_size = cache_size
+        self._encoded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def profile(self, modality):
+        profile = self.modalities.get(modality) or {}
+        return (
+            profile.get('reference_detail', 'high'),
+            profile.get('result_detail', 'high'),
+            profile.get('max_tiles', 1)
+        )
+
+    def plan(self, modality, references, results):
+        # `references` and `results` are lists of (image, source) pairs.
+        # Returns the VisionParts to send for each. Over the budget, detail is
+        # given up first (results, then references), then frames.
+        reference_detail, result_detail, max_tiles = self.profile(modality)
+        references = [VisionPart(image, reference_detail, source) for image, source in references]
+        # Only references recur across runs, results are not worth caching
+        results = [VisionPart(image, result_detail) for image, _ in results]
+
+        def total():
+            return sum(part.tokens(max_tiles) for part in references + results)
+
+        for parts in (results, references):
+            if total() > self.token_budget:
+                for part in parts:
+                    part.detail = 'low'
+        for parts in (results, references):
+            excess = total() - self.token_budget
+            if excess > 0 and len(parts) > self.min_frames:
+                keep = max(self.min_frames, len(parts) - math.ceil(excess / LOW_DETAIL_TOKENS))
+                parts[:] = _thin(parts, keep)
+        return references, results
+
+    def encode(self, part, max_tiles=1):
+        size = fit_size(*part.image.size, part.detail, max_tiles)
+        key = None
+        if part.source is not None:
+            path, frame = part.source
+            key = (os.path.abspath(path), os.stat(path).st_mtime_ns, frame, part.detail, size)
+            with self._lock:
+                if key in self._encoded:
+                    self._encoded.move_to_end(key)
+                    return self._encoded[key]
+
+        image = part.image
+        if self.image_format != 'png':
+            # JPEG has no alpha channel and no palette
+            image = image.convert('RGB')
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        if self.image_format == 'png':
+            image.save(buffer, format='PNG', optimize=True)
+        else:
+            image.save(buffer, format=self.image_format.upper(), quality=self.quality)
+        encoded = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        item = {
+            'type': 'image_url',
+            'image_url': {
+                'url': f'data:{MIME_TYPES[self.image_format]};base64,{encoded}',
+                'detail': part.detail
+            }
+        }
+
+        if key is not None:
+            with self._lock:
+                self._encoded[key] = item
+                while len(self._encoded) > self.cache_size:
+                    self._encoded.popitem(last=False)
+        return item
+
+    def content(self, modality, prompt, references, results):
+        max_tiles = self.profile(modality)[2]
+        content = [{'type': 'text', 'text': prompt}]
+        for part in references + results:
+            content.append(self.encode(part, max_tiles))
+        return content